@@ -1,7 +1,15 @@
-from . import blender_panels
-from . import pmo_export_menu
-from . import skel_io
-from . import pac_export_menu
+try:
+    import bpy
+except ImportError:  # imported by export worker processes or the standalone compiler, outside of Blender
+    bpy = None
+
+if bpy is not None:
+    from . import blender_panels
+    from . import pmo_export_menu
+    from . import skel_io
+    from . import pac_export_menu
+    from . import intermediate_export_menu
+    from . import export_session
 
 
 bl_info = {
@@ -16,6 +24,8 @@ def register():
     pmo_export_menu.register()
     skel_io.register()
     pac_export_menu.register()
+    intermediate_export_menu.register()
+    export_session.register()
 
 
 def unregister():
@@ -23,6 +33,8 @@ def unregister():
     pmo_export_menu.unregister()
     skel_io.unregister()
     pac_export_menu.unregister()
+    intermediate_export_menu.unregister()
+    export_session.unregister()
 
 if __name__ == "__main__":
     register()
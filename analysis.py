@@ -0,0 +1,173 @@
+"""
+Post-transform vertex cache simulation for built models, no bpy needed.
+
+    python -m pmo_export.analysis model.npz [--cache-size N] [--policy fifo|lru] [--json] [--lists] [--fit-indices]
+
+Indices are walked in draw order, a miss is a vertex the GE has to fetch and transform again.
+The cache is emptied at the start of every submesh, since each one sets its own vertex address.
+"""
+import argparse
+import json
+import sys
+from collections import OrderedDict, deque
+from contextlib import redirect_stdout
+
+from . import intermediate
+from . import model as pmodel
+from .compiler import compile_pmo
+from .mesh_build import BuildOptions
+
+POLICIES = ("fifo", "lru")
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self.references: int = 0
+        self.misses: int = 0
+        self.triangles: int = 0
+        self.degenerate: int = 0
+        self.vertices: int = 0  # distinct vertices referenced
+
+    @property
+    def miss_ratio(self) -> float:
+        return self.misses / self.references if self.references else 0.0
+
+    @property
+    def acmr(self) -> float:
+        """Average cache miss ratio, vertices transformed per triangle."""
+        return self.misses / self.triangles if self.triangles else 0.0
+
+    @property
+    def atvr(self) -> float:
+        """Average transform to vertex ratio, 1.0 means every vertex is transformed exactly once."""
+        return self.misses / self.vertices if self.vertices else 0.0
+
+    def add(self, other: "CacheStats") -> None:
+        self.references += other.references
+        self.misses += other.misses
+        self.triangles += other.triangles
+        self.degenerate += other.degenerate
+        self.vertices += other.vertices
+
+    def as_dict(self) -> dict:
+        return {
+            "references": self.references,
+            "misses": self.misses,
+            "triangles": self.triangles,
+            "degenerate": self.degenerate,
+            "vertices": self.vertices,
+            "miss_ratio": self.miss_ratio,
+            "acmr": self.acmr,
+            "atvr": self.atvr,
+        }
+
+
+def index_triangles(index: pmodel.Index) -> list[tuple[int, int, int]]:
+    """Triangles of a strip or list with their winding, degenerate ones included."""
+    vertices = index.vertices
+    face_order = index.face_order or 0
+    if index.primative_type == 3:
+        faces = [tuple(vertices[i:i+3]) for i in range(0, len(vertices) - 2, 3)]
+        return [(b, a, c) for a, b, c in faces] if face_order else faces
+    faces = []
+    for i in range(len(vertices) - 2):
+        a, b, c = vertices[i:i+3]
+        faces.append((b, a, c) if (i + face_order) % 2 else (a, b, c))
+    return faces
+
+
+def simulate(indices: list[pmodel.Index], size: int = 8, policy: str = "fifo") -> CacheStats:
+    """Run the index stream of one submesh through a post-transform cache of size entries."""
+    stats = CacheStats()
+    fifo: deque[int] = deque()
+    lru: OrderedDict[int, None] = OrderedDict()
+    seen = set()
+
+    for index in indices:
+        for vertex in index.vertices:
+            stats.references += 1
+            seen.add(vertex)
+            if policy == "lru":
+                if vertex in lru:
+                    lru.move_to_end(vertex)
+                    continue
+                stats.misses += 1
+                lru[vertex] = None
+                if len(lru) > size:
+                    lru.popitem(last=False)
+            else:
+                if vertex in fifo:
+                    continue
+                stats.misses += 1
+                fifo.append(vertex)
+                if len(fifo) > size:
+                    fifo.popleft()
+
+        for a, b, c in index_triangles(index):
+            if a == b or b == c or a == c:
+                stats.degenerate += 1
+            else:
+                stats.triangles += 1
+
+    stats.vertices = len(seen)
+    return stats
+
+
+def analyze_pmo(pmo: pmodel.PMO, size: int = 8, policy: str = "fifo") -> dict:
+    """Cache statistics for every submesh, every mesh header and the whole model."""
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown cache policy "{policy}", expected one of {", ".join(POLICIES)}.')
+
+    total = CacheStats()
+    report = {"cache_size": size, "policy": policy, "mesh_headers": []}
+    for header_index, mheader in enumerate(pmo.mesh_header):
+        header_total = CacheStats()
+        submeshes = []
+        for mesh in mheader.meshes:
+            stats = simulate(mesh.indices, size, policy)
+            header_total.add(stats)
+            submeshes.append({"material": mesh.tri_header.materialOffset, "bones": list(mesh.tri_header.bones),
+                              "prims": len(mesh.indices), **stats.as_dict()})
+        total.add(header_total)
+        report["mesh_headers"].append({"index": header_index, "submeshes": submeshes, **header_total.as_dict()})
+    report["total"] = total.as_dict()
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f'{report["policy"].upper()} cache, {report["cache_size"]} entries']
+    for header in report["mesh_headers"]:
+        lines.append(f'Mesh header {header["index"]}: ACMR {header["acmr"]:.3f}, ATVR {header["atvr"]:.3f}, '
+                     f'{header["degenerate"]} degenerate triangles')
+        for number, sub in enumerate(header["submeshes"]):
+            lines.append(f'\tSubmesh {number} (material {sub["material"]}, {sub["prims"]} prims, {sub["triangles"]} triangles): '
+                         f'miss ratio {sub["miss_ratio"]:.3f}, ACMR {sub["acmr"]:.3f}, ATVR {sub["atvr"]:.3f}, '
+                         f'{sub["degenerate"]} degenerate')
+    total = report["total"]
+    lines.append(f'Total: {total["triangles"]} triangles, {total["misses"]} transforms, miss ratio {total["miss_ratio"]:.3f}, '
+                 f'ACMR {total["acmr"]:.3f}, ATVR {total["atvr"]:.3f}, {total["degenerate"]} degenerate')
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pmo_export.analysis", description="Simulate the vertex cache on a compiled intermediate file.")
+    parser.add_argument("input", help="Intermediate .npz file")
+    parser.add_argument("--cache-size", type=int, default=8, help="Cache entries")
+    parser.add_argument("--policy", choices=POLICIES, default="fifo", help="Cache replacement policy")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--lists", action="store_true", help="Draw short tristrips as triangle lists when that's smaller")
+    parser.add_argument("--fit-indices", action="store_true", help="Reorder and split submeshes to fit 8 bit indices")
+    parser.add_argument("--merge-objects", action="store_true", help="Combine compatible objects and their submeshes")
+    args = parser.parse_args(argv)
+
+    # keep the builder's progress lines out of the report
+    with redirect_stdout(sys.stderr):
+        options = BuildOptions(use_lists=args.lists, fit_indices=args.fit_indices, merge_objects=args.merge_objects)
+        pmo = compile_pmo(intermediate.load(args.input), options)
+    report = analyze_pmo(pmo, args.cache_size, args.policy)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
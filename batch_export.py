@@ -0,0 +1,191 @@
+"""
+Headless batch export of PMO/PAC files.
+
+    blender -b -P batch_export.py -- manifest.json [--jobs N] [--summary summary.json] [--force]
+
+The manifest is a JSON file:
+
+{
+    "defaults": {"version": "1.2", "target": "visible", "prepare_pmo": "fast"},
+    "jobs": [
+        {"blend": "armor/helm.blend", "output": "out/helm.pac", "format": "pac", "options": {"p3rd_helmet": false}},
+        {"blend": "armor/body.blend", "output": "out/body.pmo", "format": "pmo"}
+    ]
+}
+
+Paths are relative to the manifest. Options are the keyword arguments of export_pac.export or
+pmo_export_menu.export, with the BuildOptions fields given flat next to them, "defaults" apply to every job. Every job runs in its own Blender process
+and the summary is rewritten after each one, so an interrupted run can be restarted and jobs whose
+inputs, options and output haven't changed are skipped.
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import bpy
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def addon_hash() -> str:
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(ADDON_DIR)):
+        if name.endswith(".py"):
+            digest.update(name.encode("utf-8"))
+            with open(os.path.join(ADDON_DIR, name), "rb") as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def load_jobs(manifest_path: str) -> list[dict]:
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    defaults = manifest.get("defaults", {})
+
+    jobs = []
+    for entry in manifest["jobs"]:
+        output = os.path.join(root, entry["output"])
+        jobs.append({
+            "blend": os.path.join(root, entry["blend"]),
+            "output": output,
+            "format": entry.get("format", os.path.splitext(output)[1][1:]).lower(),
+            "options": {**defaults, **entry.get("options", {})},
+        })
+    return jobs
+
+
+def job_key(job: dict, addon: str) -> str:
+    key = json.dumps({"blend": file_hash(job["blend"]), "format": job["format"], "options": job["options"], "addon": addon},
+                     sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def write_summary(path: str, summary: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as file:
+        json.dump(summary, file, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def run_job(job: dict) -> dict:
+    """Export one job on a fresh background Blender."""
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = os.path.join(tmp, "result.json")
+        env = {**os.environ, "PYTHONHASHSEED": "0"}
+        proc = subprocess.run([bpy.app.binary_path, "-b", "--factory-startup", job["blend"], "-P", os.path.abspath(__file__),
+                               "--", "--worker", json.dumps(job), "--result", result_path],
+                              env=env, capture_output=True, text=True)
+        result = {"status": "failed", "error": f'Blender exited with code {proc.returncode}'}
+        if os.path.exists(result_path):
+            with open(result_path) as file:
+                result = json.load(file)
+        if result["status"] != "ok":
+            result["log"] = proc.stdout[-4000:] + proc.stderr[-4000:]
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def worker(job: dict, result_path: str) -> None:
+    """Runs inside the Blender process opened by run_job."""
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    addon = importlib.import_module(os.path.basename(ADDON_DIR))
+
+    result = {"status": "failed"}
+    try:
+        out_dir = os.path.dirname(job["output"]) or "."
+        os.makedirs(out_dir, exist_ok=True)
+        build, options = addon.mesh_build.split_options(job["options"])
+        with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+            filepath = os.path.join(tmp, os.path.basename(job["output"]))
+            if job["format"] == "pac":
+                status = addon.export_pac.export(bpy.context, filepath, options=build, **options)
+            else:
+                status = addon.pmo_export_menu.export(bpy.context, filepath, options=build, **options)
+
+            if status == {'FINISHED'}:
+                # Only replace previous outputs once the export is complete
+                outputs = []
+                for name in sorted(os.listdir(tmp)):
+                    os.replace(os.path.join(tmp, name), os.path.join(out_dir, name))
+                    outputs.append(os.path.join(out_dir, name))
+                result = {"status": "ok", "outputs": outputs, "size": sum(os.path.getsize(path) for path in outputs)}
+            else:
+                result = {"status": "failed", "error": "Export cancelled"}
+    except Exception as e:
+        result = {"status": "failed", "error": f'{type(e).__name__}: {e}'}
+
+    with open(result_path, "w") as file:
+        json.dump(result, file)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="blender -b -P batch_export.py --")
+    parser.add_argument("manifest", nargs="?")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Blender processes to run at once")
+    parser.add_argument("--summary", help="Summary file (default: <manifest>.summary.json)")
+    parser.add_argument("--force", action="store_true", help="Export every job even if it's up to date")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(json.loads(args.worker), args.result)
+        return 0
+
+    jobs = load_jobs(args.manifest)
+    summary_path = args.summary or os.path.splitext(args.manifest)[0] + ".summary.json"
+    summary = {"jobs": {}}
+    if os.path.exists(summary_path):
+        with open(summary_path) as file:
+            summary = json.load(file)
+
+    addon = addon_hash()
+    pending = []
+    for job in jobs:
+        key = job_key(job, addon)
+        previous = summary["jobs"].get(job["output"])
+        if (not args.force and previous and previous["key"] == key and previous["status"] == "ok"
+                and all(os.path.exists(path) for path in previous["outputs"])):
+            print(f'Up to date: {job["output"]}')
+            continue
+        pending.append((job, key))
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(run_job, job): (job, key) for job, key in pending}
+        for future in as_completed(futures):
+            job, key = futures[future]
+            result = future.result()
+            summary["jobs"][job["output"]] = {"key": key, "blend": job["blend"], **result}
+            write_summary(summary_path, summary)
+            print(f'{result["status"]:>6} {result["seconds"]:8.2f}s {result.get("size", 0):>10} {job["output"]}'
+                  + (f'  ({result["error"]})' if "error" in result else ""))
+
+    results = [summary["jobs"][job["output"]] for job in jobs if job["output"] in summary["jobs"]]
+    failed = [result for result in results if result["status"] != "ok"]
+    print(f'\n{len(jobs)} jobs, {len(pending)} exported, {len(failed)} failed, '
+          f'{sum(result.get("seconds", 0) for result in results):.2f}s, '
+          f'{sum(result.get("size", 0) for result in results)} bytes')
+    print(f'Summary written to {summary_path}')
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sys.exit(main(argv))
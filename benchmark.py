@@ -0,0 +1,217 @@
+"""
+Benchmarks for the model and container hot paths on synthetic meshes, textures and skeletons, no bpy needed.
+
+    python -m pmo_export.benchmark [--full] [--only NAME ...] [--repeat N] [--save BASELINE.json]
+    python -m pmo_export.benchmark --check BASELINE.json [--threshold 0.25]
+
+The quick set runs in seconds. --full goes from 1k to 200k vertices and from 64² to 1024² textures and takes minutes.
+Timings are the best of --repeat runs. --check fails when any case got slower than the baseline by more than
+the threshold, and only cases found in both runs are compared.
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from statistics import median
+
+import numpy as np
+
+from . import export_skel
+from . import model as pmodel
+from .compiler import build_pac
+from .containers import TMH, pixelsToImage
+from .mesh_arrays import MeshArrays
+from .mesh_build import build_mesh, build_pmo
+
+QUICK = {"vertices": (1000, 10000), "textures": (64, 128), "bones": (16, 64)}
+FULL = {"vertices": (1000, 10000, 50000, 200000), "textures": (64, 256, 1024), "bones": (16, 64, 256)}
+
+GRID_WIDTH = 64
+ROWS_PER_SUBMESH = 32  # 64*33 vertices, so submeshes need 16 bit indices
+SUBMESHES_PER_OBJECT = 16
+
+MIN_SAMPLE = 0.02  # seconds, fast cases are looped until a sample takes at least this long
+
+
+def synthetic_arrays(vertex_count: int, bone_count: int = 8, seed: int = 0) -> MeshArrays:
+    """Grid with noisy heights and at least vertex_count vertices, every vertex weighted to two neighbouring bones."""
+    rng = np.random.default_rng(seed)
+    rows = max(2, -(-vertex_count // GRID_WIDTH))
+    y, x = np.divmod(np.arange(rows * GRID_WIDTH), GRID_WIDTH)
+
+    arrays = MeshArrays()
+    arrays.positions = np.stack([x / GRID_WIDTH * 2 - 1, y / rows * 2 - 1, rng.random(len(x)) * 0.1], axis=1).astype(np.float32)
+    arrays.uvs = np.stack([x / (GRID_WIDTH - 1), y / (rows - 1)], axis=1).astype(np.float32)
+    normals = rng.normal(size=(len(x), 3))
+    arrays.normals = (normals / np.linalg.norm(normals, axis=1)[:, None]).astype(np.float32)
+
+    band = y * bone_count // rows
+    first = rng.uniform(0.5, 1.0, len(x))
+    arrays.weights = np.zeros((len(x), bone_count), dtype=np.float32)
+    arrays.weights[np.arange(len(x)), band] = first
+    arrays.weights[np.arange(len(x)), (band + 1) % bone_count] = 1 - first
+    arrays.members = arrays.weights > 0
+    arrays.bone_ids = list(range(bone_count))
+    arrays.material_count = 1
+    return arrays
+
+
+def synthetic_pmo(vertex_count: int, pmo_ver: bytes = pmodel.P3RD_MODEL) -> pmodel.PMO:
+    """Model built from row strips of a synthetic grid, without stripifying."""
+    arrays = synthetic_arrays(vertex_count)
+    rows = len(arrays.positions) // GRID_WIDTH
+    abs_max = float(np.abs(arrays.positions).max())
+    scale = {"x": abs_max, "y": abs_max, "z": abs_max}
+
+    meshes = []
+    for start in range(0, rows - 1, ROWS_PER_SUBMESH):
+        tri = []
+        for row in range(start, min(start + ROWS_PER_SUBMESH, rows - 1)):
+            tri.append([v for column in range(GRID_WIDTH) for v in (row * GRID_WIDTH + column, (row + 1) * GRID_WIDTH + column)])
+        verts = sorted(set(v for strip in tri for v in strip))
+        bones = tuple((int(group), int(group)) for group in np.flatnonzero(arrays.members[verts].any(axis=0)))
+        meshes.append(build_mesh(arrays, {"material": 0}, bones, tri, scale))
+
+    mesh_headers = []
+    for start in range(0, len(meshes), SUBMESHES_PER_OBJECT):
+        mesh_header = pmodel.MeshHeader() if pmo_ver == pmodel.P3RD_MODEL else pmodel.FUMeshHeader()
+        mesh_header.scale = scale
+        mesh_header.meshes = meshes[start:start + SUBMESHES_PER_OBJECT]
+        mesh_headers.append(mesh_header)
+    return build_pmo(pmo_ver, mesh_headers, [(0, pmodel.Material())])
+
+
+def synthetic_pixels(size: int, colors: int = 200, seed: int = 0) -> list[float]:
+    """RGBA pixels of a size x size texture using at most colors distinct opaque colors."""
+    rng = np.random.default_rng(seed)
+    palette = rng.random((colors, 4)).round(3)
+    palette[:, 3] = 1.0
+    return palette[rng.integers(0, colors, size * size)].ravel().tolist()
+
+
+def synthetic_bones(count: int) -> dict[int, export_skel.PMOBone]:
+    """Chains of eight bones hanging off the root."""
+    bones = {}
+    for bone_id in range(count):
+        parent = -1 if bone_id == 0 else 0 if bone_id % 8 == 1 else bone_id - 1
+        bones[bone_id] = export_skel.PMOBone(bone_id, parent, f'bone{bone_id:03}', position=(0.0, 0.1, 0.0), scale=(1.0, 1.0, 1.0))
+    return bones
+
+
+def mesh_cases(vertex_count: int):
+    pmo = synthetic_pmo(vertex_count)
+    pmo.update()
+    yield "Mesh.to_pmo", lambda: [mesh.to_pmo(newfile=True) for mesh in pmo.meshes]
+    yield "PMO.fix_scales", pmo.fix_scales
+    yield "PMO.update", pmo.update
+    yield "PMO.save", lambda: pmo.save(BytesIO())
+    yield "Index.to_faces", lambda: [index.to_faces() for index in pmo.indexes]
+
+    tmh = TMH()
+    tmh.loadPixels(synthetic_pixels(64), 64, 64)
+    pac = build_pac(pmo, synthetic_bones(16), tmh)
+    with tempfile.TemporaryDirectory() as directory:
+        yield "PAC.save", lambda: pac.save(f'{directory}/bench.pac')
+
+
+def texture_cases(size: int):
+    pixels = synthetic_pixels(size)
+    yield "pixelsToImage", lambda: pixelsToImage(pixels, size, size)
+    image = pixelsToImage(pixels, size, size)
+    yield "GimImage.img_data", lambda: image.img_data
+    yield "Palette.bin_colors", lambda: list(image.palette.bin_colors)
+
+
+def skeleton_cases(count: int):
+    bones = synthetic_bones(count)
+    yield "export_p3rd_skel", lambda: export_skel.export_p3rd_skel(bones, BytesIO())
+    yield "export_fu_skel", lambda: export_skel.export_fu_skel(bones, BytesIO())
+
+
+SUITES = (("vertices", mesh_cases), ("textures", texture_cases), ("bones", skeleton_cases))
+
+
+def calibrate(case) -> int:
+    """Loops per sample, so sub-millisecond cases aren't dominated by timer noise."""
+    start = time.perf_counter()
+    case()
+    elapsed = time.perf_counter() - start
+    return max(1, int(MIN_SAMPLE / elapsed)) if elapsed > 0 else 1000
+
+
+def run(sizes: dict, repeat: int = 5, only: list[str] | None = None) -> dict[str, dict]:
+    """Best and median time of every case, keyed by "name[size]"."""
+    results = {}
+    for key, cases in SUITES:
+        for size in sizes[key]:
+            # builders and encoders print progress, keep it out of the report
+            with redirect_stdout(StringIO()):
+                for name, case in cases(size):
+                    if only and name not in only:
+                        continue
+                    loops = calibrate(case)
+                    times = []
+                    for _ in range(repeat):
+                        gc.collect()
+                        gc.disable()  # like timeit, collections triggered by earlier cases would land on random samples
+                        try:
+                            start = time.perf_counter()
+                            for _ in range(loops):
+                                case()
+                            times.append((time.perf_counter() - start) / loops)
+                        finally:
+                            gc.enable()
+                    label = f'{name}[{size}]'
+                    results[label] = {"best": min(times), "median": median(times), "repeat": repeat, "loops": loops}
+                    print(f'{label}: {min(times) * 1000:.2f} ms', file=sys.stderr)
+    return results
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float = 0.25) -> list[str]:
+    """Cases whose best time regressed past the threshold, as a fraction of the baseline."""
+    regressions = []
+    for label, result in results.items():
+        if label not in baseline:
+            continue
+        ratio = result["best"] / baseline[label]["best"]
+        if ratio > 1 + threshold:
+            regressions.append(f'{label}: {baseline[label]["best"] * 1000:.2f} ms -> {result["best"] * 1000:.2f} ms ({ratio:.2f}x)')
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pmo_export.benchmark", description="Time the model and container hot paths.")
+    parser.add_argument("--full", action="store_true", help="Run every size, up to 200k vertices and 1024x1024 textures")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="Only run these cases, like PMO.save or pixelsToImage")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of every case, the best one counts")
+    parser.add_argument("--save", metavar="BASELINE", help="Save the results as a baseline")
+    parser.add_argument("--check", metavar="BASELINE", help="Fail if any case regressed against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown allowed by --check, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    results = run(FULL if args.full else QUICK, args.repeat, args.only)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, f, indent=2)
+
+    if args.check is not None:
+        with open(args.check) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            return 1
+        print(f'{len(set(results) & set(baseline))} cases within {args.threshold:.0%} of the baseline')
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
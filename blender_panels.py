@@ -1,5 +1,6 @@
 import bpy
 from .prep_pmo import xenthos_prep_pmo, asterisk_prep_pmo
+from . import report
 
 bpy.types.Material.pmo_diffuse = bpy.props.FloatVectorProperty(size=4, default=(1.0, 1.0, 1.0, 1.0), min=0, max=1,
                                                         subtype='COLOR', name='Diffuse')
@@ -79,11 +80,55 @@ class AsPreparePmo(bpy.types.Operator):
         asterisk_prep_pmo(context.active_object)
         return {'FINISHED'}
 
+class PMOBudgetPanel(bpy.types.Panel):
+    bl_label = "PMO Budget"
+    bl_idname = "VIEW3D_PT_pmo_budget"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "PMO"
+
+    @classmethod
+    def poll(cls, context):
+        return report.LAST_REPORT is not None
+
+    def draw(self, context):
+        last = report.LAST_REPORT
+        totals = last["totals"]
+        layout = self.layout
+
+        layout.label(text=f'PMO {last["version"]}: {last["filesize"]} bytes')
+        col = layout.column(align=True)
+        for section in report.SECTIONS:
+            row = col.row()
+            row.label(text=section.replace("_", " ").capitalize())
+            row.label(text=str(last["sections"][section]))
+
+        col = layout.column(align=True)
+        col.label(text=f'Submeshes: {totals["submeshes"]}')
+        col.label(text=f'Prims: {totals["prims"]}')
+        col.label(text=f'GE commands: {totals["ge_commands"]}')
+        col.label(text=f'Vertices: {totals["vertices"]}')
+
+        if last.get("build"):
+            col = layout.column(align=True)
+            for name, (before, after) in last["build"].items():
+                row = col.row()
+                row.label(text=name.replace("_", " ").capitalize())
+                row.label(text=f'{before} -> {after}')
+
+        if "textures" in last:
+            col = layout.column(align=True)
+            for number, tex in enumerate(last["textures"]):
+                col.label(text=f'Texture {number}: {tex["width"]}x{tex["height"]} CLUT{tex["clut_bits"]}, {tex["vram"]} bytes')
+            col.label(text=f'Texture VRAM: {totals["vram"]} bytes')
+
+
 def register():
     bpy.utils.register_class(PMOMaterialPanel)
     bpy.utils.register_class(PreparePmoPanel)
     bpy.utils.register_class(XePreparePmo)
     bpy.utils.register_class(AsPreparePmo)
+    bpy.utils.register_class(PMOBudgetPanel)
 
 
 def unregister():
@@ -91,6 +136,7 @@ def unregister():
     bpy.utils.unregister_class(PreparePmoPanel)
     bpy.utils.unregister_class(XePreparePmo)
     bpy.utils.unregister_class(AsPreparePmo)
+    bpy.utils.unregister_class(PMOBudgetPanel)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+"""
+Standalone compiler for intermediate files written from Blender, no bpy needed.
+
+    python -m pmo_export.compiler model.npz -o model.pmo [--processes N] [--split]
+    python -m pmo_export.compiler model.npz -o model.pac [--helmet FACE_FLAGS HAIR_FLAGS PHYS_ID]
+
+FACE_FLAGS is the packed face flag mask, bit n set for the n-th face flag of the PAC exporter.
+"""
+import argparse
+import dataclasses
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from struct import pack
+
+from . import export_skel
+from . import intermediate
+from . import model as pmodel
+from . import profiling
+from .containers import TMH, PAC
+from .mesh_build import BuildOptions, PmoExportError, build_mesh_header, build_pmo
+
+
+def compile_pmo(data: intermediate.Intermediate, options: BuildOptions = BuildOptions(), processes: int = 1) -> pmodel.PMO:
+    # tristripification and material remaps were chosen when the intermediate file was written
+    options = dataclasses.replace(options, hard_tristripification=data.hard_tristripification, use_mat_remaps=data.use_mat_remaps)
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            jobs = [executor.submit(build_mesh_header, obj, data.pmo_ver, options) for obj in data.objects]
+            mesh_headers = [job.result() for job in jobs]
+    else:
+        mesh_headers = [build_mesh_header(obj, data.pmo_ver, options) for obj in data.objects]
+
+    return build_pmo(data.pmo_ver, mesh_headers, data.materials, options)
+
+
+def face_mask(face_flags: tuple[bool]) -> int:
+    return sum([2**p for p, v in enumerate(face_flags) if v])
+
+
+def helmet_data(face_mask: int, hairflags: int, phys_id: int) -> bytes:
+    return pack("<2HI", face_mask, hairflags, phys_id)
+
+
+def write_skeleton(ver: bytes, bones: dict[int, export_skel.PMOBone], f) -> None:
+    if ver == pmodel.P3RD_MODEL:
+        export_skel.export_p3rd_skel(bones, f)
+    elif ver == pmodel.FU_MODEL:
+        export_skel.export_fu_skel(bones, f)
+
+
+def pac_size(pmo: pmodel.PMO, bones: dict[int, export_skel.PMOBone], tmh: TMH, helmet: bytes | None = None) -> int:
+    """Size of the PAC build_pac would save, from a laid out model and the sizes of the textures."""
+    skeleton = BytesIO()
+    write_skeleton(pmo.ver, bones, skeleton)
+    lengths = [pmo.header.filesize, len(skeleton.getvalue()), tmh.size]
+    if helmet is not None:
+        lengths.append(len(helmet))
+    offset, length = PAC.layout(lengths)[-1]
+    return offset + length
+
+
+def build_pac(pmo: pmodel.PMO, bones: dict[int, export_skel.PMOBone], tmh: TMH, helmet: bytes | None = None) -> PAC:
+    """PAC with the model, its skeleton, its textures and the P3rd helmet flags if there are any."""
+    pac = PAC()
+
+    f = pac.add()
+    pmo.save(f)
+
+    f = pac.add()
+    write_skeleton(pmo.ver, bones, f)
+
+    f = pac.add()
+    tmh.buildTMH(f)
+
+    if helmet is not None:
+        f = pac.add()
+        f.write(helmet)
+
+    return pac
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pmo_export.compiler", description="Compile intermediate files into PMO/PAC files.")
+    parser.add_argument("input", help="Intermediate .npz file")
+    parser.add_argument("-o", "--output", required=True, help="Output file, .pac files also get the skeleton and textures")
+    parser.add_argument("--processes", type=int, default=1, help="Build objects on this many processes")
+    parser.add_argument("--split", action="store_true", help="Separate headers and mesh data (PMO only)")
+    parser.add_argument("--elide-states", action="store_true", help="Don't repeat flat shading and face order shared by consecutive submeshes")
+    parser.add_argument("--sort-submeshes", action="store_true", help="Order submeshes by material and render state")
+    parser.add_argument("--lists", action="store_true", help="Draw short tristrips as triangle lists when that's smaller")
+    parser.add_argument("--fit-indices", action="store_true", help="Reorder and split submeshes to fit 8 bit indices")
+    parser.add_argument("--vertex-tolerances", nargs=3, type=float, metavar=("POSITION", "UV", "NORMAL"),
+                        help="Store each submesh's vertices in the smallest formats within these errors")
+    parser.add_argument("--local-scales", action="store_true", help="Scale each object to its own bounds (P3rd only)")
+    parser.add_argument("--weight-threshold", type=float, default=0.0, help="Drop bone influences below this weight")
+    parser.add_argument("--max-influences", type=int, default=0, help="Keep at most this many bone influences per vertex")
+    parser.add_argument("--merge-objects", action="store_true", help="Combine compatible objects and their submeshes")
+    parser.add_argument("--share-vertices", action="store_true", help="Store each object's vertices once per vertex format")
+    parser.add_argument("--intern-tables", action="store_true", help="Write identical bone palettes and materials once")
+    parser.add_argument("--profile", action="store_true", help="Write stage timings to OUTPUT.profile.json and OUTPUT.trace.json")
+    parser.add_argument("--helmet", nargs=3, type=int, metavar=("FACE_FLAGS", "HAIR_FLAGS", "PHYS_ID"), help="Export as P3rd helmet (PAC only), FACE_FLAGS is the packed face flag mask")
+    args = parser.parse_args(argv)
+
+    with profiling.profiled(args.output if args.profile else None):
+        data = intermediate.load(args.input)
+        try:
+            options = BuildOptions(use_lists=args.lists, fit_indices=args.fit_indices, weight_threshold=args.weight_threshold,
+                                   max_influences=args.max_influences, elide_states=args.elide_states,
+                                   sort_submeshes=args.sort_submeshes,
+                                   vertex_tolerances=None if args.vertex_tolerances is None else tuple(args.vertex_tolerances),
+                                   local_scales=args.local_scales, merge_objects=args.merge_objects,
+                                   share_vertices=args.share_vertices, intern_tables=args.intern_tables)
+            pmo = compile_pmo(data, options, args.processes)
+        except PmoExportError as e:
+            parser.error(*e.args)
+
+        if args.output.lower().endswith(".pac"):
+            if data.bones is None:
+                parser.error("Intermediate file has no skeleton or textures, it can only be compiled to a PMO.")
+            tmh = TMH()
+            for pixels, width, height in data.textures:
+                tmh.loadPixels(pixels.tolist(), width, height)
+            helmet = None
+            if args.helmet is not None:
+                helmet = helmet_data(*args.helmet)
+            build_pac(pmo, data.bones, tmh, helmet).save(args.output)
+        elif args.split:
+            with open(args.output+"_header.pmo", 'wb') as f1, open(args.output+"_mesh.bin", 'wb') as f2:
+                pmo.save(f1, second=f2)
+        else:
+            with open(args.output, 'wb') as f:
+                pmo.save(f)
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -23,10 +23,10 @@ struct GIM {
     palette Palette
 }
 """
-import bpy
 try:
     from PIL import Image
 except:
+    import bpy
     from subprocess import check_output
     import sys
 
@@ -39,6 +39,8 @@ from enum import Enum
 from typing import BinaryIO
 from io import BytesIO
 
+from .profiling import span
+
 INDEX_FORMAT = [
     (4, 4),  # CLUT4
     (5, 8),  # CLUT8
@@ -142,16 +144,24 @@ class TMH:
     def img_count(self) -> int:
         return len(self.images)
 
+    @property
+    def size(self) -> int:
+        return 0x10 + sum(img.size for img in self.images)
+
     def buildTMH(self, fd) -> None:
-        fd.write(b'.TMH0.14')
-        fd.write(pack("I4x", self.img_count))
-        
-        for img in self.images:
-            img.write(fd)
+        with span("texture encode"):
+            fd.write(b'.TMH0.14')
+            fd.write(pack("I4x", self.img_count))
+
+            for img in self.images:
+                img.write(fd)
     
     def loadImg(self, node) -> None:
         self.images.append(nodeToImage(node))
 
+    def loadPixels(self, pixels: list[float], width: int, height: int) -> None:
+        self.images.append(pixelsToImage(pixels, width, height))
+
 
 class Palette:
     def __init__(self, color_priority: bool = False) -> None:
@@ -215,34 +225,60 @@ class Palette:
 
 
 def nodeToImage(node) -> GimImage:
-    img = list(node.image.pixels)
-    img = list(zip(img[::4], img[1::4], img[2::4], img[3::4]))
     width, height = node.image.size
-    array = []
-    for row in range(height):
-        row = []
-        array.append(row)
-        for column in range(width):
-            row.append(img.pop(0))
+    return pixelsToImage(list(node.image.pixels), width, height)
+
+
+def pixelsToImage(img: list[float], width: int, height: int) -> GimImage:
+    with span("texture palette"):
+        img = list(zip(img[::4], img[1::4], img[2::4], img[3::4]))
+        array = []
+        for row in range(height):
+            row = []
+            array.append(row)
+            for column in range(width):
+                row.append(img.pop(0))
     
-    pixels = list(reversed(array))
+        pixels = list(reversed(array))
 
-    colors = []
-    indices = []
-    for row in pixels:
-        for column in row:
-            if tuple(column) not in colors:
-                colors.append(tuple(column))
-            indices.append(colors.index(tuple(column)))
+        colors = []
+        indices = []
+        for row in pixels:
+            for column in row:
+                if tuple(column) not in colors:
+                    colors.append(tuple(column))
+                indices.append(colors.index(tuple(column)))
 
-    colors = list(map(lambda y: list(map(lambda x: x, y)), colors))
+        colors = list(map(lambda y: list(map(lambda x: x, y)), colors))
     
-    gim = GimImage()
-    pal = gim.palette
+        gim = GimImage()
+        pal = gim.palette
+
+        gim.width, gim.height = width, height
+        gim.pixels = indices
+        pal.colors = colors
+        return gim
+
+
+def nodePixels(node) -> tuple[np.ndarray, int, int]:
+    width, height = node.image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    node.image.pixels.foreach_get(pixels)
+    return pixels, width, height
 
+
+def nodeToEstimate(node) -> GimImage:
+    return pixelsToEstimate(*nodePixels(node))
+
+
+def pixelsToEstimate(img: np.ndarray, width: int, height: int) -> GimImage:
+    """Image with the palette pixelsToImage would build but without pixel indices, enough for its sizes and formats."""
+    colors = np.unique(np.asarray(img).reshape(-1, 4), axis=0)
+
+    gim = GimImage()
     gim.width, gim.height = width, height
-    gim.pixels = indices
-    pal.colors = colors
+    gim.pixels = [len(colors) - 1]  # only the largest index decides the CLUT depth
+    gim.palette.colors = colors.tolist()
     return gim
 
 
@@ -250,20 +286,29 @@ class PAC:
     def __init__(self) -> None:
         self.files: list[BinaryIO] = []
     
-    def save(self, path: str):
-        with open(path, "wb") as file:
-            file_start: int = 4 + 8 * len(self.files)
-            file_start += 16 - (file_start % 16)
-            file_data: list[tuple[int, int]] = []
-
-            file.write(pack("I", len(self.files)))
-            file.seek(file_start)
+    @staticmethod
+    def layout(lengths: list[int]) -> list[tuple[int, int]]:
+        """Offset and length of every file, each one starts on the next 16 byte boundary."""
+        offset = 4 + 8 * len(lengths)
+        offset += 16 - (offset % 16)
+        file_data: list[tuple[int, int]] = []
+        for length in lengths:
+            offset += 16 - (offset % 16)
+            file_data.append((offset, length))
+            offset += length
+        return file_data
 
+    def save(self, path: str):
+        with span("PAC write"), open(path, "wb") as file:
+            entries = []
             for entry in self.files:
-                file.seek(file.tell() + 16 - (file.tell() % 16))
                 entry.seek(0)
-                data = entry.read()
-                file_data.append((file.tell(), len(data)))
+                entries.append(entry.read())
+            file_data = self.layout([len(data) for data in entries])
+
+            file.write(pack("I", len(self.files)))
+            for (offset, length), data in zip(file_data, entries):
+                file.seek(offset)
                 file.write(data)
             
             file.seek(4)
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import bpy
+
+TICK = 0.05  # seconds between timer events of a background export
+CHUNK = 0.03  # seconds of export steps run per timer event, the rest of the tick is Blender's
+POLL = 0.01  # seconds a step waits on the worker before giving the time back
+
+# events that only move the view or the cursor, passed on while the steps still read the scene
+VIEW_EVENTS = frozenset(("MOUSEMOVE", "INBETWEEN_MOUSEMOVE", "WHEELUPMOUSE", "WHEELDOWNMOUSE", "WHEELINMOUSE", "WHEELOUTMOUSE",
+                         "MIDDLEMOUSE", "TRACKPADPAN", "TRACKPADZOOM", "MOUSEROTATE", "MOUSESMARTZOOM", "NDOF_MOTION",
+                         "WINDOW_DEACTIVATE"))
+
+
+class Worker(ThreadPoolExecutor):
+    """Background thread for the pure Python stages of an export, submesh building, textures and encoding.
+
+    cancel() drops queued jobs, a write that is already running finishes into its temporary file and leaves
+    the exported file alone.
+    """
+    def __init__(self) -> None:
+        super().__init__(max_workers=1, thread_name_prefix="pmo_export")
+        self.cancelled: threading.Event = threading.Event()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        self.shutdown(wait=False, cancel_futures=True)
+
+
+def finished(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def submit(worker, fn, *args, **kwargs) -> Future:
+    """Run fn on the worker, or right away without one."""
+    if worker is None:
+        return finished(fn(*args, **kwargs))
+    return worker.submit(fn, *args, **kwargs)
+
+
+def waiting(jobs: list[Future], stage: str, block: bool = True):
+    """Export step waiting for jobs, yields progress until they're done unless it should block."""
+    pending = set(jobs)
+    while pending:
+        _, pending = wait(pending, timeout=None if block else POLL)
+        yield stage, len(jobs) - len(pending), len(jobs)
+
+
+def run_steps(steps):
+    """Run export steps to the end and return their result."""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+@contextmanager
+def atomic_write(path: str, cancelled: threading.Event | None = None):
+    """Path of a temporary file that replaces path once the block is done, a failed or cancelled write
+    leaves the previous file as it was."""
+    temp = path+".tmp"
+    try:
+        yield temp
+        if cancelled is None or not cancelled.is_set():
+            os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+class BackgroundExport:
+    """Modal export operator mixin, runs export steps from a timer so Blender stays responsive.
+
+    Steps are generators yielding (stage, done, total). bpy reads happen in the steps themselves, a few per
+    timer event, while the pure Python stages go to the worker. Esc closes the steps, which runs their cleanup,
+    and cancels the worker.
+
+    Objects, images and skeletons are held across steps, so until the steps' last scene read only view navigation
+    is passed on, clicks and keys could run operators deleting what the next step reads. Everything is passed on
+    in scene_free_stages.
+    """
+    scene_free_stages: frozenset[str] = frozenset()
+
+    def start_background(self, context, export_steps, **kwargs) -> set[str]:
+        self.worker = Worker()
+        self.steps = export_steps(context, worker=self.worker, **kwargs)
+        self.stage = ""
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(TICK, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event) -> set[str]:
+        if event.type == 'ESC':
+            self.cancel(context)
+            self.report({'WARNING'}, "Export cancelled")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            if self.stage in self.scene_free_stages or event.type in VIEW_EVENTS:
+                return {'PASS_THROUGH'}
+            return {'RUNNING_MODAL'}
+
+        deadline = time.perf_counter() + CHUNK
+        try:
+            while time.perf_counter() < deadline:
+                self.stage, done, total = next(self.steps)
+        except StopIteration as stop:
+            self.finish(context)
+            return stop.value
+        except Exception:
+            self.cancel(context)
+            raise
+
+        context.window_manager.progress_update(100 * done // max(total, 1))
+        context.workspace.status_text_set(f'{self.stage} {done}/{total}, Esc to cancel')
+        return {'RUNNING_MODAL'}
+
+    def finish(self, context) -> None:
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        self.worker.shutdown(wait=False)
+
+    def cancel(self, context) -> None:
+        # temporary copies only live within a step, closing the steps shuts down their worker processes too
+        self.steps.close()
+        self.worker.cancel()
+        self.finish(context)
@@ -1,57 +1,81 @@
 from . import export_pmo
 from . import export_skel
+from . import report
 from .export_pmo import warning
-from .containers import TMH, PAC, ColorLimitError
+from .export_job import atomic_write, finished, run_steps, submit, waiting
+from .compiler import build_pac, face_mask, helmet_data, pac_size
+from .mesh_build import BuildOptions, apply_flat_options
+from .containers import TMH, ColorLimitError, nodePixels, nodeToEstimate, pixelsToImage
 from .model import P3RD_MODEL, FU_MODEL
-from struct import pack
 
 import bpy
 
 class NoSkeletonError(Exception):
     ...
 
-def export(context, filepath: str, version: str, target: str = 'scene', prepare_pmo: str = "none", cleanup_vg: bool = False, p3rd_helmet: bool = False, face_flags: tuple[bool] | None = None, hairflags: int | None = None, phys_id: int | None = None, app_modifiers: bool = False, hard_tristripification: bool = False, do_fix_vg: bool = False):
+def write_pac(pmo, bones, tmh: TMH, helmet: bytes | None, filepath: str, write_report: bool = False, cancelled=None) -> None:
+    with atomic_write(filepath, cancelled) as path:
+        build_pac(pmo, bones, tmh, helmet).save(path)
+
+    if write_report and not (cancelled is not None and cancelled.is_set()):
+        report.LAST_REPORT = report.pmo_report(pmo, tmh)
+        report.write_report(report.LAST_REPORT, filepath+".report.json")
+
+def export_steps(context, filepath: str, version: str, target: str = 'scene', prepare_pmo: str = "none", cleanup_vg: bool = False,
+                 p3rd_helmet: bool = False, face_flags: tuple[bool] | None = None, hairflags: int | None = None, phys_id: int | None = None,
+                 app_modifiers: bool = False, hard_tristripification: bool | None = None, do_fix_vg: bool = False, processes: int = 1,
+                 use_cache: bool = False, options: BuildOptions = BuildOptions(), write_report: bool = False, dry_run: bool = False,
+                 session=None, worker=None, **flat_options):
+    # BuildOptions fields as keywords are deprecated, see export_pmo.export_steps
+    options = apply_flat_options(options, dict(flat_options, hard_tristripification=hard_tristripification))
     try:
         skeletons = [obj for obj in bpy.data.objects if obj.type == "EMPTY" and not obj.parent]
         if len(skeletons) == 0:
             raise NoSkeletonError()
         
-        pac = PAC()
         ver = P3RD_MODEL if version == "1.2" else FU_MODEL
 
-        pmo, textures = export_pmo.export(ver, target, prepare_pmo, cleanup_vg, get_textures=True, apply_modifiers=app_modifiers, hard_tristripification=hard_tristripification, do_fix_vg=do_fix_vg)
+        pmo, textures = yield from export_pmo.export_steps(ver, target, prepare_pmo, cleanup_vg, get_textures=True, apply_modifiers=app_modifiers,
+                                                           do_fix_vg=do_fix_vg, processes=processes, use_cache=use_cache, options=options,
+                                                           session=session, worker=worker)
         if isinstance(pmo, int):
             return {'CANCELLED'}
         
-        f = pac.add()
-        pmo.save(f)
-
-        f = pac.add()
-        
         skeleton = skeletons[0]
         if skeleton.type == "EMPTY":
             bones = export_skel.bonesFromEmpties(skeleton)
         elif skeleton.type == "ARMATURE":
-            export_skel.bonesFromArmature(skeleton)
+            bones = export_skel.bonesFromArmature(skeleton)
         else:
             return {'CANCELLED'}
         
-        if ver == P3RD_MODEL:
-            export_skel.export_p3rd_skel(bones, f)
-        elif ver == FU_MODEL:
-            export_skel.export_fu_skel(bones, f)
-        
-        f = pac.add()
         tmh = TMH()
-        for texture in textures:
-            tmh.loadImg(texture)
-        tmh.buildTMH(f)
+        helmet = helmet_data(face_mask(face_flags), hairflags, phys_id) if p3rd_helmet else None
+
+        if dry_run:  # palettes are enough for the texture sizes, nothing gets swizzled, encoded or written
+            tmh.images = [nodeToEstimate(texture) for texture in textures]
+            if any(image.data_type == -1 for image in tmh.images):
+                raise ColorLimitError
+            pmo.update()
+            estimate = report.pmo_estimate(pmo, tmh)
+            estimate["filesize"] = pac_size(pmo, bones, tmh, helmet)
+            return estimate
 
-        if p3rd_helmet:
-            f  = pac.add()
-            f.write(pack("<2HI", sum([2**p for p, v in enumerate(face_flags) if v]), hairflags, phys_id))
+        jobs = []
+        for number, texture in enumerate(textures):
+            yield "Reading textures", number, len(textures)
+            if session is not None:
+                jobs.append(finished(session.load_image(texture)))
+            else:
+                # only reading the pixels needs bpy, the palette is built on the worker
+                pixels, width, height = nodePixels(texture)
+                jobs.append(submit(worker, pixelsToImage, pixels.tolist(), width, height))
+        yield from waiting(jobs, "Encoding textures", block=worker is None)
+        tmh.images = [job.result() for job in jobs]
 
-        pac.save(filepath)
+        job = submit(worker, write_pac, pmo, bones, tmh, helmet, filepath, write_report, None if worker is None else worker.cancelled)
+        yield from waiting([job], "Writing", block=worker is None)
+        job.result()
         
         return {'FINISHED'}
     except ColorLimitError:
@@ -60,3 +84,8 @@ def export(context, filepath: str, version: str, target: str = 'scene', prepare_
     except NoSkeletonError:
         warning(["Scene doesn't contain a valid skeleton."], "Error")
         return {'CANCELLED'}
+
+
+def export(*args, **kwargs):
+    """Run every export step at once, see export_steps."""
+    return run_steps(export_steps(*args, **kwargs))
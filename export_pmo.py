@@ -1,5 +1,8 @@
 import bpy
 import bmesh
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from . import model as pmodel
 from .prep_pmo import xenthos_prep_pmo, asterisk_prep_pmo, sharp_seam_prep_pmo
 
@@ -12,8 +15,11 @@ except:
     check_output([sys.executable, '-m', 'pip', 'install', 'pyffi', f'--target={bpy.utils.user_resource("SCRIPTS", path="modules")}'])
     from pyffi.utils import trianglestripifier
 
-class PmoExportError(Exception):
-    ...
+from .mesh_arrays import MeshArrays, from_mesh, read_groups, source_hash
+from .mesh_cache import MeshCache
+from .mesh_build import BuildOptions, PmoExportError, apply_flat_options, build_mesh_header, build_pmo
+from .export_job import finished, run_steps, submit, waiting
+from .profiling import span
 
 def fix_vg(obj):
     bpy.ops.object.mode_set(mode='EDIT')
@@ -37,39 +43,39 @@ def fix_vg(obj):
     bpy.ops.object.mode_set(mode='OBJECT')
 
 def sort_vertices(obj):
-    print("Sorting vertices...")
-    bpy.ops.object.mode_set(mode='EDIT')
-    me = obj.data
-    bm = bmesh.from_edit_mesh(me)
-    bmv = bm.verts
-    bmv.ensure_lookup_table()
-
-    mats = []
-    for mat in obj.data.materials:
-        mats.append([list(face.vertices) for face in obj.data.polygons if face.material_index == len(mats)])
-    verts = []
-    for x in mats:
-        vs = set()
-        for face in x:
-            for v in face:
-                vs.add(v)
-
-        groups = {}
-        for v in vs:
-            for g in [g.group for g in me.vertices[v].groups]:
-                groups[g] = groups[g] + [v] if g in groups else [v]
-        verts.append(groups)
-
-    ind = 0
-    for mat in verts:
-        for g in mat.values():
-            for v in g:
-                bmv[v].index = ind
-                ind += 1
-    bm.verts.sort()
-
-    bmesh.update_edit_mesh(me)
-    bpy.ops.object.mode_set(mode='OBJECT')
+    with span("sort"):
+        bpy.ops.object.mode_set(mode='EDIT')
+        me = obj.data
+        bm = bmesh.from_edit_mesh(me)
+        bmv = bm.verts
+        bmv.ensure_lookup_table()
+
+        mats = []
+        for mat in obj.data.materials:
+            mats.append([list(face.vertices) for face in obj.data.polygons if face.material_index == len(mats)])
+        verts = []
+        for x in mats:
+            vs = set()
+            for face in x:
+                for v in face:
+                    vs.add(v)
+
+            groups = {}
+            for v in vs:
+                for g in [g.group for g in me.vertices[v].groups]:
+                    groups[g] = groups[g] + [v] if g in groups else [v]
+            verts.append(groups)
+
+        ind = 0
+        for mat in verts:
+            for g in mat.values():
+                for v in g:
+                    bmv[v].index = ind
+                    ind += 1
+        bm.verts.sort()
+
+        bmesh.update_edit_mesh(me)
+        bpy.ops.object.mode_set(mode='OBJECT')
 
 
 def pmo_material(material, tex: int | None = None):
@@ -92,6 +98,11 @@ def pmo_material(material, tex: int | None = None):
     return pmaterial
 
 def warning(messages: list[str] = [""], title: str = "Warning"):
+    if bpy.app.background:  # no window to show a popup on
+        for message in messages:
+            print(f'{title}: {message}')
+        return
+
     def draw(self, context):
         for message in messages:
             self.layout.label(text=message)
@@ -103,61 +114,63 @@ def mat_tex(mat):
             return node
     return -1
 
-def export(pmo_ver: bytes, target: str = 'scene', prepare_pmo: str = "none", cleanup_vg: bool = False, get_textures: bool = False, 
-           apply_modifiers: bool = False, hard_tristripification: bool = False, do_fix_vg: bool = False, use_mat_remaps: bool = False) -> tuple[pmodel.PMO | int, list | None]:
-    try:
-        print("Exporting PMO...")
-
-        pmo = pmodel.PMO()
-        pmo.header.ver = pmo_ver
-        pmo.use_mat_remap = use_mat_remaps
-        warnings = []
-
-        match target:
-            case "scene":  # scene
-                objs = [obj for obj in bpy.context.scene.objects if obj.type == "MESH"]
-            
-            case "visible":  # visible
-                objs = [obj for obj in bpy.context.scene.objects if obj.type == "MESH" and not obj.hide_get()]
-
-            case "selection":  # selection
-                objs = [obj for obj in bpy.context.scene.objects if obj.type == "MESH" and obj.select_get()]
-
-            case "active":  # active
-                objs = [bpy.context.active_object]
-
-        # Deselect every object
-        for obj in bpy.data.objects:
-            obj.select_set(False)
-
-        if len(objs) == 0:
-            warning(["No valid meshes found"])
-            return -1, None
-
-        cumulativeWeightCount = 0
-        materials: dict[str, int] = {}
-        pmo_mats: list[pmodel.Material] = []
-        textures: list = []
-        texture_indices: dict[str, int] = {}
-        
-        for base_obj in objs:
-            obj = base_obj.copy()
-            obj.data = base_obj.data.copy()
-            obj.hide_set(False)
-            bpy.context.collection.objects.link(obj)
-
-            bpy.context.view_layer.objects.active = obj
-            obj.select_set(True)
+IN_MEMORY_PREP = ("none", "fast")
+
+# Built mesh headers of previous exports in this session
+EXPORT_CACHE = MeshCache()
+
+def check_triangulated(mesh) -> None:
+    loop_total = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    if (loop_total != 3).any():
+        raise PmoExportError("Mesh is not triangulated.")
+
+def read_evaluated(base_obj, depsgraph, mat_ids: np.ndarray, prepare_pmo: str = "none", apply_modifiers: bool = False,
+                   groups: tuple | None = None) -> MeshArrays:
+    """Read an object into arrays without touching the scene.
+
+    With modifiers the evaluated mesh is only alive while it's being read, otherwise the object's
+    own mesh is read as is. Vertices end up in the order sort_vertices gives the prepared copies.
+    groups are the object's vertex group elements if its cache key read them already.
+    """
+    split = prepare_pmo == "fast"
+    if not apply_modifiers:
+        if not split:
+            check_triangulated(base_obj.data)
+        with span("extraction"):
+            arrays = from_mesh(base_obj.data, base_obj.vertex_groups, mat_ids, split=split, groups=groups)
+    else:
+        with span("prep"):
+            eval_obj = base_obj.evaluated_get(depsgraph)
+            mesh = eval_obj.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+        try:
+            if not split:
+                check_triangulated(mesh)
+            with span("extraction"):
+                arrays = from_mesh(mesh, base_obj.vertex_groups, mat_ids, split=split, groups=groups)
+        finally:
+            eval_obj.to_mesh_clear()
+    return arrays
+
+def read_prepared_copy(base_obj, mat_ids: np.ndarray, prepare_pmo: str = "none", cleanup_vg: bool = False,
+                       apply_modifiers: bool = False, do_fix_vg: bool = False) -> MeshArrays:
+    """Read an object after running the operator based prep scripts on a temporary copy of it."""
+    obj = base_obj.copy()
+    obj.data = base_obj.data.copy()
+    obj.hide_set(False)
+    bpy.context.collection.objects.link(obj)
+
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
 
+    try:
+        with span("prep"):
             if apply_modifiers:
                 bpy.ops.object.convert(target="MESH")
 
             if cleanup_vg:
                 bpy.ops.object.vertex_group_clean(group_select_mode="ALL")
 
-            if len([v for v in obj.data.vertices if len(v.groups) == 0]):
-                warnings.append(f'Object "{base_obj.name}" has vertices that are not tied to any vertex group and those will not be exported.')
-
             if do_fix_vg:
                 fix_vg(obj)
 
@@ -171,234 +184,217 @@ def export(pmo_ver: bytes, target: str = 'scene', prepare_pmo: str = "none", cle
                 case _:
                     pass
 
+        if prepare_pmo != "fast":  # fast splits and sorts vertices while reading the mesh arrays
             sort_vertices(obj)
+            check_triangulated(obj.data)
 
-            mesh_header = pmodel.MeshHeader() if pmo_ver == pmodel.P3RD_MODEL else pmodel.FUMeshHeader()
-            mesh_header.materialCount = len(obj.material_slots)
-            mesh_header.tristripCount = len(obj.vertex_groups)
-
-            if "PMO Alpha Blending Params" in obj:
-                mesh_header.alpha_blending_params = obj["PMO Alpha Blending Params"]
-            
-            if "PMO Light Distance Attenuation Factor" in obj:
-                mesh_header.ld_at_factor_c = obj["PMO Light Distance Attenuation Factor"]
-
-            # Scale definition
-            maxx = max(max([vert.co.x for vert in obj.data.vertices]),
-                    -1 * min([vert.co.x for vert in obj.data.vertices]))
-            maxy = max(max([vert.co.y for vert in obj.data.vertices]),
-                    -1 * min([vert.co.y for vert in obj.data.vertices]))
-            maxz = max(max([vert.co.z for vert in obj.data.vertices]),
-                    -1 * min([vert.co.z for vert in obj.data.vertices]))
-            abs_max = max(maxx, maxy, maxz)
-            scale = {"x": abs_max, "y": abs_max, "z": abs_max}
-            if pmo_ver == pmodel.P3RD_MODEL:
-                mesh_header.scale = scale
-
-            print("Constructing materials...")
-            mesh_header.materials = []
-            for mat in obj.data.materials:
-                if mat.name not in materials:
-                    try:
-                        mat_id = int(mat.name.split("_")[-1]) if "_" in mat.name else len(materials)
-                    except ValueError:
-                        raise PmoExportError("One or more materials do not follow the appropriate naming conventions.")
-                    materials[mat.name] = mat_id
-                    tex = None
-                    if get_textures:
-                        if not mat.pmo_overwrite_texture_index:
-                            texture = mat_tex(mat)
-                            if texture == -1:
-                                raise PmoExportError(f'Material ({mat.name}) is missing a texture. (or texture override)')
-                            if texture.image.name not in texture_indices:
-                                texture_indices[texture.image.name] = len(textures)
-                                textures.append(texture)
-                            tex = texture_indices[texture.image.name]
-                    pmo_mats.append((mat_id, pmo_material(mat, tex=tex)))
-                    
-            # *&'s code for mats and pmo attributes
-            metalayers = list(filter(lambda x: "PMO " in x.name,obj.data.attributes))
-            facetuples = list(zip(map(lambda x: materials[obj.data.materials[x.material_index].name], obj.data.polygons),
-                                *map(lambda x: map(lambda y: y.value, x.data), metalayers)))
-            metamats = {tp:[] for tp in sorted(list(set(facetuples)))}
-            labels = list(map(lambda x: x.name.replace("PMO ",""), metalayers))
-            for ix,face in enumerate(obj.data.polygons):
-                metamats[facetuples[ix]].append(list(face.vertices))
-
-            ready = []
-            for props, face_collection in metamats.items():
-                tris = {}
-                try:
-                    me = trianglestripifier.Mesh(faces=face_collection)
-                    tristripifier = trianglestripifier.TriangleStripifier(me)
-                    tristrips = tristripifier.find_all_strips()  # indices
-                except ValueError as e:
-                    match e.args[0]:
-                        case 'too many values to unpack (expected 3)':
-                            raise PmoExportError("Mesh is not triangulated.")
-                        case 'Degenerate face.':
-                            raise PmoExportError("Mesh contains degenerate face(s).")
-                        case _:
-                            raise
+        with span("extraction"):
+            return from_mesh(obj.data, obj.vertex_groups, mat_ids, split=prepare_pmo == "fast")
+    finally:
+        mesh = obj.data
+        bpy.data.objects.remove(obj, do_unlink=True)
+        bpy.data.meshes.remove(mesh)
+
+def target_objects(target: str = 'scene') -> list:
+    match target:
+        case "scene":  # scene
+            return [obj for obj in bpy.context.scene.objects if obj.type == "MESH"]
+
+        case "visible":  # visible
+            return [obj for obj in bpy.context.scene.objects if obj.type == "MESH" and not obj.hide_get()]
+
+        case "selection":  # selection
+            return [obj for obj in bpy.context.scene.objects if obj.type == "MESH" and obj.select_get()]
+
+        case "active":  # active
+            return [bpy.context.active_object]
+
+class SceneReader:
+    """Reads objects into MeshArrays, collecting their materials and textures along the way."""
+    def __init__(self, prepare_pmo: str = "none", cleanup_vg: bool = False, get_textures: bool = False,
+                 apply_modifiers: bool = False, do_fix_vg: bool = False) -> None:
+        self.prepare_pmo: str = prepare_pmo
+        self.cleanup_vg: bool = cleanup_vg
+        self.get_textures: bool = get_textures
+        self.apply_modifiers: bool = apply_modifiers
+        self.do_fix_vg: bool = do_fix_vg
+
+        self.materials: dict[str, int] = {}
+        self.pmo_mats: list[tuple[int, pmodel.Material]] = []
+        self.textures: list = []
+        self.texture_indices: dict[str, int] = {}
+        self.warnings: list[str] = []
+        self.depsgraph = bpy.context.evaluated_depsgraph_get()
+        # vertex group elements read for cache keys, handed on to the read of the same object
+        self.groups: dict[str, tuple] = {}
+
+    @property
+    def in_memory(self) -> bool:
+        return self.prepare_pmo in IN_MEMORY_PREP and not self.do_fix_vg
+
+    def read_materials(self, base_obj) -> np.ndarray:
+        for mat in base_obj.data.materials:
+            if mat.name not in self.materials:
                 try:
-                    for tri in tristrips:
-                        bones = set()
-                        for x in [[x.group for x in obj.data.vertices[v].groups] for v in tri]:
-                            for bone in x:
-                                bones.add((int(bpy.context.active_object.vertex_groups[bone].name.split(".")[-1]), obj.vertex_groups[bone].index))
-                        bones = tuple(bones)
-                        tris[bones] = tris[bones] + [tri] if bones in tris.keys() else [tri]
+                    mat_id = int(mat.name.split("_")[-1]) if "_" in mat.name else len(self.materials)
                 except ValueError:
-                    raise PmoExportError("One or more bones (vertex groups) do not follow the appropriate naming conventions.")
-                
-                # Join all tristrips
-                if hard_tristripification:
-                    for bones, tristrips in tris.items():
-                        stripest: list = []
-                        if len(tristrips) > 1:
-                            tristrips = sorted(tristrips)
-                            for strip in range(len(tristrips)):
-                                if len(stripest) > 0 and len(stripest) % 2 == 0:
-                                    stripest.append(stripest[-1])
-                                if strip < len(tristrips) - 1:
-                                    tristrips[strip].append(tristrips[strip][-1])
-                                new = [tristrips[strip][0]] if strip > 0 else []
-                                new.extend(tristrips[strip])
-                                stripest.extend(new)
-                        else:
-                            stripest = tristrips[0]
-                        tris[bones] = [stripest]
-
-                ready.append(({k: v for k, v in zip(["material"] + labels, props)}, tris))
-
-            uvs = {}
-            for face in obj.data.polygons:
-                for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-                    if vert_idx not in uvs:
-                        uvs[vert_idx] = [*obj.data.uv_layers.active.data[loop_idx].uv]
-            
-            obj.data.calc_tangents()
-            
-            normals = {}
-            warn_multiple_normal = False
-            for l in obj.data.loops:
-                if l.vertex_index not in normals:
-                    normals[l.vertex_index] = l.normal
-                else:
-                    warn_multiple_normal = warn_multiple_normal or (normals[l.vertex_index] != l.normal)
-            
-            if warn_multiple_normal:
-                warnings.append(f'Because of some vertex having multiple normals, exported normals may not look as they do in the editor for "{base_obj.name}".')
-
-            meshes = []
-            print("Creating meshes...")
-            for mesh in ready:
-                print("Creating mesh...")
-                props = mesh[0]
-                for (bones, tri) in mesh[1].items():  # tri header/submesh creation
-                    tristrip_header = pmodel.TristripHeader()
-                    tristrip_header.materialOffset = props["material"]
-                    print(tristrip_header.materialOffset, [id for id, index in bones])
-                    tristrip_header.cumulativeWeightCount = cumulativeWeightCount
-                    tristrip_header.weightCount = len(bones)
-                    cumulativeWeightCount += tristrip_header.weightCount
-                    tristrip_header.bones = [id for id, index in bones]
-                    
-                    if "Bypass Transform" in props:
-                        tristrip_header.bypass_transform = props["Bypass Transform"] > 0
-                    if "Backface Culling" in props:
-                        tristrip_header.backface_culling = props["Backface Culling"] > 0
-                    if "Alpha Test Enable" in props:
-                        tristrip_header.alpha_blend = props["Alpha Test Enable"] > 0
-                    if  "Shade Flat" in props:
-                        tristrip_header.shade_flat = props["Shade Flat"]
-                    if "Texture Filter" in props:
-                        tristrip_header.custom_tex_filter = True
-                        tristrip_header.texture_filter = props["Texture Filter"]
-
-                    # mesh creation
-                    me = pmodel.Mesh()
-                    me.tri_header = tristrip_header
-                    me.vertex_format = pmodel.VertexFormat(
-                        weight_count = tristrip_header.weightCount,
-                        weight_f = pmodel.BYTE,
-                        uv_f = pmodel.SHORT,
-                        normal_f = pmodel.BYTE,
-                        position_f = pmodel.SHORT
-                    )
-
-                    me.base_offset = 0
-
-                    verts = []
-                    for x in tri:
-                        verts.extend(x)
-                    vert_remap = {v: k for k, v in enumerate(sorted(set(verts)))}
-
-                    max_index = max(0, *[max(x) for x in tri])
-                    me.index_format = "B" if max_index <= 255 else "H" if max_index <= 0xFFFF else "I"
-                    me.indices = []
-                    
-                    for ind in tri:
-                        index = pmodel.Index(me.index_format)
-                        index.vertices = [vert_remap[v] for v in ind]
-                        index.primative_type = 4  # tristrip mode
-                        index.index_offset = 0
-                        index.face_order = 0
-                        me.indices.append(index)
-
-                    me.vertices = []
-
-                    print("Adding vertices...")
-                    for v_idx in sorted(set(verts)):
-                        vert = obj.data.vertices[v_idx]
-                        vertex = pmodel.Vertex()
-                        if tristrip_header.bypass_transform:
-                            vertex.nortrans = 0x1
-                            vertex.postrans = 0x1
-                            vertex.textrans = 0x1
-                            vertex.weitrans = 0x1
-                        else:
-                            vertex.nortrans = 0x7f
-                            vertex.postrans = 0x7fff
-                            vertex.textrans = 0x8000
-                            vertex.weitrans = 0x80
-                        vertex.verfor = me.vertex_format.struct
-
-                        vertex.coords(vert.co.x, vert.co.y, vert.co.z)
-                        vertex.vt(uvs[vert.index][0], 1 - uvs[vert.index][1])
-                        vertex.scale = scale
-                        vertex.vn(*normals[vert.index])
-                        
-                        vertex.w = []
-                        for bone in [index for id, index in bones]:
-                            if bone in [vg.group for vg in vert.groups]:
-                                weight = [vg.weight for vg in vert.groups if vg.group == bone][0]
-                                vertex.w.append(weight)
-                            else:
-                                vertex.w.append(0)
-
-                        me.vertices.append(vertex)
-
-                    meshes.append(me)
-
-            mesh_header.meshes = meshes
-
-            pmo.mesh_header.append(mesh_header)
-            
-            bpy.data.objects.remove(obj, do_unlink=True)
-
-        # Adding materials
-        for _, mat in sorted(pmo_mats, key=lambda x: x[0]):
-            pmo.materials.append(mat)
-        print(pmo.materials)
+                    raise PmoExportError("One or more materials do not follow the appropriate naming conventions.")
+                self.materials[mat.name] = mat_id
+                tex = None
+                if self.get_textures:
+                    if not mat.pmo_overwrite_texture_index:
+                        texture = mat_tex(mat)
+                        if texture == -1:
+                            raise PmoExportError(f'Material ({mat.name}) is missing a texture. (or texture override)')
+                        if texture.image.name not in self.texture_indices:
+                            self.texture_indices[texture.image.name] = len(self.textures)
+                            self.textures.append(texture)
+                        tex = self.texture_indices[texture.image.name]
+                self.pmo_mats.append((mat_id, pmo_material(mat, tex=tex)))
+
+        return np.array([self.materials[mat.name] for mat in base_obj.data.materials] or [0], dtype=np.int64)
+
+    def cache_key(self, base_obj, mat_ids: np.ndarray, *options) -> str:
+        extra = (self.prepare_pmo, self.cleanup_vg, self.apply_modifiers, self.do_fix_vg, base_obj.get("PMO Alpha Blending Params"),
+                 base_obj.get("PMO Light Distance Attenuation Factor"), *options)
+        if not self.apply_modifiers:
+            return self.source_hash(base_obj, base_obj.data, mat_ids, *extra)
+
+        eval_obj = base_obj.evaluated_get(self.depsgraph)
+        mesh = eval_obj.to_mesh(preserve_all_data_layers=True, depsgraph=self.depsgraph)
+        try:
+            return self.source_hash(base_obj, mesh, mat_ids, *extra)
+        finally:
+            eval_obj.to_mesh_clear()
+
+    def source_hash(self, base_obj, mesh, mat_ids: np.ndarray, *extra) -> str:
+        # bpy only hands out deform weights vertex by vertex, so that read is done once per object
+        groups = read_groups(mesh, len(base_obj.vertex_groups))
+        if self.in_memory:
+            self.groups[base_obj.name] = groups
+        return source_hash(mesh, base_obj.vertex_groups, mat_ids, *extra, groups=groups)
+
+    def read(self, base_obj, mat_ids: np.ndarray | None = None) -> MeshArrays:
+        if mat_ids is None:
+            mat_ids = self.read_materials(base_obj)
+        if self.in_memory:
+            arrays = read_evaluated(base_obj, self.depsgraph, mat_ids, self.prepare_pmo, self.apply_modifiers,
+                                    self.groups.pop(base_obj.name, None))
+            if self.cleanup_vg:
+                arrays.clean_weights()
+        else:
+            arrays = read_prepared_copy(base_obj, mat_ids, self.prepare_pmo, self.cleanup_vg, self.apply_modifiers, self.do_fix_vg)
+        arrays.name = base_obj.name
+
+        if arrays.unweighted:
+            self.warnings.append(f'Object "{base_obj.name}" has vertices that are not tied to any vertex group and those will not be exported.')
+
+        if "PMO Alpha Blending Params" in base_obj:
+            arrays.alpha_blending_params = base_obj["PMO Alpha Blending Params"]
+
+        if "PMO Light Distance Attenuation Factor" in base_obj:
+            arrays.ld_at_factor_c = base_obj["PMO Light Distance Attenuation Factor"]
+
+        if arrays.multiple_normals:
+            self.warnings.append(f'Because of some vertex having multiple normals, exported normals may not look as they do in the editor for "{base_obj.name}".')
+
+        return arrays
+
+def read_targets(target: str, reader: SceneReader) -> list | None:
+    objs = target_objects(target)
+
+    # Deselect every object, the prep scripts work on the selected copy
+    if not reader.in_memory:
+        for obj in bpy.data.objects:
+            obj.select_set(False)
+
+    if len(objs) == 0:
+        warning(["No valid meshes found"])
+        return None
+    return objs
+
+def export_steps(pmo_ver: bytes, target: str = 'scene', prepare_pmo: str = "none", cleanup_vg: bool = False, get_textures: bool = False, 
+                 apply_modifiers: bool = False, hard_tristripification: bool | None = None, do_fix_vg: bool = False,
+                 use_mat_remaps: bool | None = None, processes: int = 1, use_cache: bool = False,
+                 options: BuildOptions = BuildOptions(), session=None, worker=None, **flat_options):
+    """Export as a generator of (stage, done, total) steps, one object read per step, returning what export returns.
+
+    With a worker, submeshes and the PMO are built on it while the steps wait for them without blocking.
+    hard_tristripification, use_mat_remaps and other BuildOptions fields passed as keywords are deprecated
+    and override options.
+    """
+    options = apply_flat_options(options, dict(flat_options, hard_tristripification=hard_tristripification,
+                                               use_mat_remaps=use_mat_remaps))
+    executor = None
+    try:
+        print("Exporting PMO...")
+
+        reader = SceneReader(prepare_pmo, cleanup_vg, get_textures, apply_modifiers, do_fix_vg)
+        objs = read_targets(target, reader)
+        if objs is None:
+            return -1, None
+
+        # Stripification and submesh building only need the mesh arrays, so with more than one process
+        # they run on worker processes while the next objects are being read
+        if processes > 1:
+            executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+        builder = executor or worker
+        jobs = []
+
+        # A live session knows which objects changed since its last export, otherwise compare contents
+        cache = cache_key = None
+        if session is not None:
+            cache, cache_key = session.cache, session.cache_key
+        elif use_cache:
+            cache, cache_key = EXPORT_CACHE, reader.cache_key
+        cache_entries = []
+        for number, base_obj in enumerate(objs):
+            yield "Reading objects", number, len(objs)
+            mat_ids = reader.read_materials(base_obj)
+            if cache is not None:
+                key = cache_key(base_obj, mat_ids, pmo_ver, *options.mesh_key)
+                cached = cache.get(key)
+                if cached is not None:
+                    mesh_header, warnings = cached
+                    reader.warnings.extend(warnings)
+                    cache_entries.append(None)
+                    jobs.append(finished(mesh_header))
+                    continue
+
+            first_warning = len(reader.warnings)
+            arrays = reader.read(base_obj, mat_ids)
+            if cache is not None:
+                cache_entries.append((key, reader.warnings[first_warning:]))
+
+            jobs.append(submit(builder, build_mesh_header, arrays, pmo_ver, options))
+
+        # Collected in object order, so weight offsets don't depend on which worker finished first
+        yield from waiting(jobs, "Building submeshes", block=worker is None)
+        mesh_headers = [job.result() for job in jobs]
+
+        if cache is not None:
+            for mesh_header, entry in zip(mesh_headers, cache_entries):
+                if entry is not None:
+                    cache.put(entry[0], mesh_header, entry[1])
+            print(f'Reused {cache_entries.count(None)} of {len(objs)} meshes from cache')
+        job = submit(worker, build_pmo, pmo_ver, mesh_headers, reader.pmo_mats, options)
+        yield from waiting([job], "Building PMO", block=worker is None)
+        pmo = job.result()
 
         print("Export finished!\n\n")
 
-        if warnings:
-            warning(warnings)
+        if reader.warnings:
+            warning(reader.warnings)
 
-        return (pmo, None) if not get_textures else (pmo, textures)
+        return (pmo, None) if not get_textures else (pmo, reader.textures)
     except PmoExportError as e:
-        bpy.data.objects.remove(obj, do_unlink=True)
         warning(e.args, "Error")
         return -1, None
+    finally:
+        if executor is not None:
+            # cancelling a background export shouldn't wait on the processes still building
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def export(*args, **kwargs) -> tuple[pmodel.PMO | int, list | None]:
+    """Run every export step at once, see export_steps."""
+    return run_steps(export_steps(*args, **kwargs))
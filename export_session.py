@@ -0,0 +1,186 @@
+import pickle
+from collections import defaultdict
+
+import bpy
+import numpy as np
+
+from .containers import GimImage, nodeToImage
+from .export_pmo import IN_MEMORY_PREP
+from .mesh_cache import MeshCache
+
+
+class ExportSession:
+    """Live export session, re-exports to the same file rebuilding only what changed since the last export.
+
+    depsgraph_update_post marks mesh objects whose geometry changed, materials and images. Objects are
+    cached by name and a generation counter bumped on every change, so untouched objects reuse the mesh
+    header built last time and untouched images their GIM image. Only the in-memory prep modes can run
+    in a session, the others link and edit copies of the objects and every export would mark them again.
+    """
+    def __init__(self, exporter, **kwargs) -> None:
+        self.exporter = exporter
+        self.kwargs: dict = kwargs
+        self.cache: MeshCache = MeshCache()
+        self.generations: defaultdict[str, int] = defaultdict(int)
+        self.images: dict[str, bytes] = {}
+        self.dirty_images: set[str] = set()
+        self.export_on_save: bool = True
+
+    @property
+    def filepath(self) -> str:
+        return self.kwargs["filepath"]
+
+    def cache_key(self, base_obj, mat_ids: np.ndarray, *options) -> str:
+        # the properties the reader copies off the object, changing them doesn't update its geometry
+        return repr((base_obj.name, self.generations[base_obj.name], mat_ids.tolist(), base_obj.get("PMO Alpha Blending Params"),
+                     base_obj.get("PMO Light Distance Attenuation Factor"), *options))
+
+    def mark_object(self, name: str) -> None:
+        self.generations[name] += 1
+
+    def mark_material(self, material) -> None:
+        # material ids come from names and are already part of the key, but texture and attribute
+        # changes are cheap enough to just rebuild every user
+        for obj in bpy.data.objects:
+            if obj.type == "MESH" and material.name in obj.data.materials:
+                self.mark_object(obj.name)
+
+    def load_image(self, node) -> GimImage:
+        name = node.image.name
+        if name in self.dirty_images or name not in self.images:
+            self.images[name] = pickle.dumps(nodeToImage(node))
+            self.dirty_images.discard(name)
+        return pickle.loads(self.images[name])
+
+    def on_depsgraph_update(self, scene, depsgraph) -> None:
+        for update in depsgraph.updates:
+            data = update.id.original
+            if isinstance(data, bpy.types.Object):
+                # transforms aren't exported, selection and other object updates don't touch the mesh
+                if data.type == "MESH" and update.is_updated_geometry:
+                    self.mark_object(data.name)
+            elif isinstance(data, bpy.types.Mesh):
+                if not update.is_updated_geometry:
+                    continue
+                for obj in bpy.data.objects:
+                    if obj.data == data:
+                        self.mark_object(obj.name)
+            elif isinstance(data, bpy.types.Material):
+                self.mark_material(data)
+            elif isinstance(data, bpy.types.Image):
+                self.dirty_images.add(data.name)
+
+    def on_save(self, *args) -> None:
+        if self.export_on_save:
+            self.export()
+
+    def export(self) -> set[str]:
+        return self.exporter(bpy.context, session=self, **self.kwargs)
+
+
+SESSION: ExportSession | None = None
+
+
+def _depsgraph_update_post(scene, depsgraph):
+    if SESSION is not None:
+        SESSION.on_depsgraph_update(scene, depsgraph)
+
+
+def _save_post(*args):
+    if SESSION is not None:
+        SESSION.on_save(*args)
+
+
+# the other handlers go away with the file, the session has to go with them
+@bpy.app.handlers.persistent
+def _load_pre(*args):
+    stop()
+
+
+def unsupported(prepare_pmo: str = "none", do_fix_vg: bool = False, **kwargs) -> str | None:
+    """Why a session can't run with these export options, None if it can."""
+    if prepare_pmo not in IN_MEMORY_PREP or do_fix_vg:
+        return 'Live sessions need Prepare PMO set to "None" or "Fast" and Fix Vertex Groups off'
+    return None
+
+
+def start(exporter, **kwargs) -> ExportSession:
+    global SESSION
+    stop()
+    SESSION = ExportSession(exporter, **kwargs)
+    bpy.app.handlers.depsgraph_update_post.append(_depsgraph_update_post)
+    bpy.app.handlers.save_post.append(_save_post)
+    return SESSION
+
+
+def stop() -> None:
+    global SESSION
+    SESSION = None
+    if _depsgraph_update_post in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_update_post)
+    if _save_post in bpy.app.handlers.save_post:
+        bpy.app.handlers.save_post.remove(_save_post)
+
+
+class SessionExport(bpy.types.Operator):
+    """Export again to the live session's file, rebuilding only what changed."""
+    bl_idname = "export_mh.session_export"
+    bl_label = "Export Now"
+
+    @classmethod
+    def poll(cls, context):
+        return SESSION is not None
+
+    def execute(self, context):
+        return SESSION.export()
+
+
+class SessionStop(bpy.types.Operator):
+    """Stop the live export session."""
+    bl_idname = "export_mh.session_stop"
+    bl_label = "Stop Session"
+
+    @classmethod
+    def poll(cls, context):
+        return SESSION is not None
+
+    def execute(self, context):
+        stop()
+        return {'FINISHED'}
+
+
+class ExportSessionPanel(bpy.types.Panel):
+    bl_label = "PMO Live Export"
+    bl_idname = "VIEW3D_PT_pmo_export_session"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "PMO"
+
+    @classmethod
+    def poll(cls, context):
+        return SESSION is not None
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.label(text=bpy.path.basename(SESSION.filepath))
+        layout.label(text=f'Cached meshes: {len(SESSION.cache.entries)}')
+        row = layout.row()
+        row.operator(SessionExport.bl_idname)
+        row.operator(SessionStop.bl_idname)
+
+
+def register():
+    bpy.app.handlers.load_pre.append(_load_pre)
+    bpy.utils.register_class(SessionExport)
+    bpy.utils.register_class(SessionStop)
+    bpy.utils.register_class(ExportSessionPanel)
+
+
+def unregister():
+    stop()
+    if _load_pre in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(_load_pre)
+    bpy.utils.unregister_class(SessionExport)
+    bpy.utils.unregister_class(SessionStop)
+    bpy.utils.unregister_class(ExportSessionPanel)
@@ -1,4 +1,7 @@
-import bpy
+try:
+    import bpy
+except ImportError:  # the skeleton writers are also used by the standalone compiler
+    bpy = None
 from struct import pack
 
 
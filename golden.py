@@ -0,0 +1,621 @@
+"""
+Golden output regression harness, runs the exporters outside of Blender against stored outputs.
+
+    python -m pmo_export.golden             # compare every output with golden/
+    python -m pmo_export.golden --update    # accept the current outputs as the new golden files
+    python -m pmo_export.golden --capture   # write the synthetic scenes to golden/inputs as intermediate files
+    python -m pmo_export.golden --reference DIR  # write reference files from the exporter checked out in DIR
+
+Synthetic scenes go through export_pmo/export_pac with a minimal bpy/bmesh stub, for FU (1.0) and P3rd (1.2), producing
+PMO, AHI, TMH and PAC files. Intermediate files in golden/inputs, the captured ones written from Blender included,
+go through the standalone compiler. Outputs have to match byte for byte, mismatches are reported with the
+structures they fall in.
+
+The files listed in golden/REFERENCE come from another checkout of the exporter, the default options on the scenes
+with prepare PMO "none" that its copy-based path can export. Everything else is a snapshot of this tree's own output.
+"""
+import argparse
+import copy
+import importlib
+import os
+import sys
+import tempfile
+import types
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from pathlib import Path
+from struct import error as StructError, unpack_from
+
+import numpy as np
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+INPUT_DIR = GOLDEN_DIR / "inputs"
+
+VERSIONS = (("fu", "1.0"), ("p3rd", "1.2"))
+
+OPTIMIZED = dict(elide_states=True, sort_submeshes=True, use_lists=True, fit_indices=True, vertex_tolerances=(0.005, 1/2048, 0.01),
+                 local_scales=True, weight_threshold=0.05, max_influences=2, merge_objects=True, share_vertices=True, intern_tables=True)
+
+
+# bpy stub, what the in-memory export paths touch and the baseline's copy path does for prepare PMO "none"
+
+class Collection(list):
+    """bpy_prop_collection stand-in."""
+    def foreach_get(self, attr, out) -> None:
+        out[:] = np.asarray([getattr(item, attr) for item in self], dtype=out.dtype).reshape(-1)
+
+
+class DataObjects(list):
+    """bpy.data.objects stand-in."""
+    def remove(self, obj, do_unlink: bool = False) -> None:
+        if obj in self:
+            super().remove(obj)
+
+
+class Co(tuple):
+    """mathutils.Vector stand-in for vertex positions."""
+    x = property(lambda self: self[0])
+    y = property(lambda self: self[1])
+    z = property(lambda self: self[2])
+
+
+class StubMesh(types.SimpleNamespace):
+    def copy(self) -> "StubMesh":
+        # materials are shared between copies, like bpy's Mesh.copy
+        return copy.deepcopy(self, {id(self.materials): self.materials})
+
+    def calc_tangents(self) -> None:
+        pass
+
+
+class BMVerts(list):
+    """Vertices of a bmesh.from_edit_mesh stand-in, sort() reorders the mesh by the indices set on them."""
+    def __init__(self, mesh: StubMesh) -> None:
+        super().__init__(types.SimpleNamespace(index=index) for index in range(len(mesh.vertices)))
+        self.mesh = mesh
+
+    def ensure_lookup_table(self) -> None:
+        pass
+
+    def sort(self) -> None:
+        order = sorted(range(len(self)), key=lambda vert: self[vert].index)
+        remap = {old: new for new, old in enumerate(order)}
+        self.mesh.vertices = Collection(self.mesh.vertices[old] for old in order)
+        for index, vert in enumerate(self.mesh.vertices):
+            vert.index = index
+        for polygon in self.mesh.polygons:
+            polygon.vertices = [remap[vert] for vert in polygon.vertices]
+        for loop in self.mesh.loops:
+            loop.vertex_index = remap[loop.vertex_index]
+
+
+class LayerObjects:
+    """view_layer.objects stand-in, setting the active object sets context.active_object."""
+    def __init__(self, context) -> None:
+        self.context = context
+
+    @property
+    def active(self):
+        return self.context.active_object
+
+    @active.setter
+    def active(self, obj) -> None:
+        self.context.active_object = obj
+
+
+class Pixels(list):
+    def foreach_get(self, out) -> None:
+        out[:] = self
+
+
+class StubObject:
+    def __init__(self, name: str, type: str, data=None, vertex_groups=(), parent=None, props: dict | None = None,
+                 location=(0.0, 0.0, 0.0), rotation_euler=(0.0, 0.0, 0.0), scale=(1.0, 1.0, 1.0)) -> None:
+        self.name = name
+        self.type = type
+        self.data = data
+        self.vertex_groups = list(vertex_groups)
+        self.parent = parent
+        self.children = []
+        self.props = props or {}
+        self.location, self.rotation_euler, self.scale = location, rotation_euler, scale
+        if parent is not None:
+            parent.children.append(self)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.props
+
+    def __getitem__(self, key: str):
+        return self.props[key]
+
+    def get(self, key: str, default=None):
+        return self.props.get(key, default)
+
+    def hide_get(self) -> bool:
+        return False
+
+    def select_get(self) -> bool:
+        return True
+
+    def select_set(self, state: bool) -> None:
+        pass
+
+    @property
+    def material_slots(self) -> list:
+        return self.data.materials
+
+    def copy(self) -> "StubObject":
+        clone = copy.copy(self)
+        clone.children = []
+        return clone
+
+    def hide_set(self, state: bool) -> None:
+        pass
+
+    def evaluated_get(self, depsgraph) -> "StubObject":
+        return self
+
+    def to_mesh(self, **kwargs):
+        return self.data
+
+    def to_mesh_clear(self) -> None:
+        pass
+
+
+def install_stubs() -> types.ModuleType:
+    """Put the bpy and bmesh stubs into sys.modules, they have to be there before the exporters are imported."""
+    bpy = sys.modules.get("bpy")
+    if bpy is not None:
+        if not getattr(bpy, "is_stub", False):
+            raise RuntimeError("The golden harness replaces bpy, run it outside of Blender.")
+        return bpy
+
+    bpy = types.ModuleType("bpy")
+    bpy.is_stub = True
+    bpy.app = types.SimpleNamespace(background=True)
+    bpy.context = types.SimpleNamespace(scene=types.SimpleNamespace(objects=[]), active_object=None,
+                                        evaluated_depsgraph_get=lambda: None,
+                                        collection=types.SimpleNamespace(objects=types.SimpleNamespace(link=lambda obj: None)),
+                                        window_manager=types.SimpleNamespace(popup_menu=lambda *args, **kwargs: None))
+    bpy.context.view_layer = types.SimpleNamespace(objects=LayerObjects(bpy.context))
+    bpy.data = types.SimpleNamespace(objects=DataObjects())
+    bpy.ops = types.SimpleNamespace(object=types.SimpleNamespace(mode_set=lambda **kwargs: None))
+    bmesh = types.ModuleType("bmesh")
+    bmesh.from_edit_mesh = lambda mesh: types.SimpleNamespace(verts=BMVerts(mesh))
+    bmesh.update_edit_mesh = lambda mesh: None
+    sys.modules["bpy"] = bpy
+    sys.modules["bmesh"] = bmesh
+    return bpy
+
+
+def set_scene(bpy: types.ModuleType, objects: list[StubObject]) -> None:
+    bpy.context.scene.objects = [obj for obj in objects if obj.type == "MESH"]
+    bpy.data.objects = DataObjects(objects)
+
+
+# synthetic scenes
+
+def stub_image(name: str, size: int, colors: int, alpha: bool = False, seed: int = 0) -> types.SimpleNamespace:
+    rng = np.random.default_rng(seed)
+    palette = rng.integers(0, 16, (colors, 4)) / 15
+    palette[:, 3] = rng.integers(0, 2, colors) if alpha else 1.0
+    pixels = palette[rng.integers(0, colors, size * size)].astype(np.float32)
+    return types.SimpleNamespace(name=name, size=(size, size), pixels=Pixels(pixels.ravel().tolist()))
+
+
+def stub_material(name: str, image, diffuse=(1.0, 1.0, 1.0, 1.0)) -> types.SimpleNamespace:
+    return types.SimpleNamespace(name=name, pmo_diffuse=diffuse, pmo_ambient=(0.5, 0.5, 0.5, 1.0), pmo_texture_index=0,
+                                 pmo_overwrite_texture_index=False,
+                                 node_tree=types.SimpleNamespace(nodes=[types.SimpleNamespace(type="TEX_IMAGE", image=image)]))
+
+
+def grid_object(name: str, size: int, materials: list, bones: list[str], offset=(0.0, 0.0, 0.0), seam: bool = False,
+                culling: bool = False, tiling: float = 1.0, props: dict | None = None) -> StubObject:
+    """Triangulated size x size grid bent along x, weighted across the bones from left to right.
+
+    With seam the right half gets shifted UVs, so the fast prep has vertices to split. UVs go up to tiling.
+    """
+    verts = []
+    for y in range(size + 1):
+        for x in range(size + 1):
+            u, v = x / size, y / size
+            position = (u * 2 - 1 + offset[0], v * 2 - 1 + offset[1], (u - 0.5) ** 2 + offset[2])
+            spot = u * (len(bones) - 1)
+            first = min(int(spot), len(bones) - 2) if len(bones) > 1 else 0
+            blend = spot - first
+            groups = [types.SimpleNamespace(group=first, weight=1 - blend)]
+            if len(bones) > 1 and blend > 0:
+                groups.append(types.SimpleNamespace(group=first + 1, weight=blend))
+            verts.append(types.SimpleNamespace(index=len(verts), co=Co(position), groups=Collection(groups)))
+
+    tris = []
+    for y in range(size):
+        for x in range(size):
+            a = y * (size + 1) + x
+            tris += [(a, a + 1, a + size + 2), (a, a + size + 2, a + size + 1)]
+
+    loops, polygons, triangles = Collection(), Collection(), Collection()
+    for index, tri in enumerate(tris):
+        polygons.append(types.SimpleNamespace(material_index=(index // (2 * size)) % len(materials), loop_start=3 * index,
+                                              loop_total=3, loop_indices=range(3 * index, 3 * index + 3), use_smooth=True,
+                                              vertices=list(tri)))
+        triangles.append(types.SimpleNamespace(loops=(3 * index, 3 * index + 1, 3 * index + 2), polygon_index=index))
+        right = sum(verts[v].co[0] for v in tri) / 3 > offset[0]
+        for v in tri:
+            x, y, z = verts[v].co
+            uv = (((x - offset[0] + 1) / 2 + (0.25 if seam and right else 0.0)) * tiling, (y - offset[1] + 1) / 2 * tiling)
+            loops.append(types.SimpleNamespace(vertex_index=v, uv=uv, normal=(-(x - offset[0]), 0.0, 1.0)))
+
+    attributes = []
+    if culling:
+        values = Collection(types.SimpleNamespace(value=index % 3 == 0) for index in range(len(tris)))
+        attributes.append(types.SimpleNamespace(name="PMO Backface Culling", data_type="INT", data=values))
+
+    mesh = StubMesh(name=name, vertices=Collection(verts), loops=loops, polygons=polygons, attributes=attributes,
+                    materials=materials, uv_layers=types.SimpleNamespace(active=types.SimpleNamespace(data=loops)),
+                    loop_triangles=triangles, calc_loop_triangles=lambda: None)
+    return StubObject(name, "MESH", mesh, [types.SimpleNamespace(name=bone, index=index) for index, bone in enumerate(bones)],
+                      props=props)
+
+
+def skeleton(bones: list[str]) -> list[StubObject]:
+    """Root empty and a chain of bone empties under it."""
+    root = StubObject("skeleton", "EMPTY")
+    objects, parent = [root], root
+    for index, name in enumerate(bones):
+        bone = StubObject(name, "EMPTY", parent=parent, props={"id": index}, location=(0.0, 0.5, 0.0),
+                          rotation_euler=(0.0, 0.0, 0.1 * index))
+        objects.append(bone)
+        parent = bone
+    return objects
+
+
+def grid_scene() -> tuple[list[StubObject], str]:
+    bones = ["bone.000", "bone.001", "bone.002"]
+    image = stub_image("grid.png", 32, 24)
+    materials = [stub_material("body_0", image), stub_material("trim_1", image, (0.8, 0.6, 0.4, 1.0))]
+    return [grid_object("grid", 10, materials, bones, culling=True)] + skeleton(bones), "none"
+
+
+def parts_scene() -> tuple[list[StubObject], str]:
+    bones = ["bone.000", "bone.001", "bone.002", "bone.003"]
+    opaque, cutout = stub_image("opaque.png", 64, 40, seed=1), stub_image("cutout.png", 16, 6, alpha=True, seed=2)
+    materials = [stub_material("skin_0", opaque), stub_material("hair_1", cutout)]
+    objects = [
+        grid_object("body", 8, materials, bones, seam=True),
+        grid_object("hair", 4, materials[1:], bones[2:], offset=(0.5, 1.0, 0.25), seam=True,
+                    props={"PMO Alpha Blending Params": 0x20}),
+    ]
+    return objects + skeleton(bones), "fast"
+
+
+def tiled_scene() -> tuple[list[StubObject], str]:
+    """Texture repeated three times over more than 256 vertices, UVs only fit once the scales are fixed."""
+    bones = ["bone.000", "bone.001"]
+    materials = [stub_material("floor_0", stub_image("tile.png", 16, 8, seed=3))]
+    return [grid_object("floor", 30, materials, bones, tiling=3.0)] + skeleton(bones), "none"
+
+
+SCENES = {"grid": grid_scene, "parts": parts_scene, "tiled": tiled_scene}
+
+
+# outputs
+
+def textures_of(objects: list[StubObject]) -> list:
+    """Texture nodes in the order the exporter collects them."""
+    nodes, seen = [], set()
+    for obj in objects:
+        if obj.type != "MESH":
+            continue
+        for mat in obj.data.materials:
+            node = mat.node_tree.nodes[0]
+            if node.image.name not in seen:
+                seen.add(node.image.name)
+                nodes.append(node)
+    return nodes
+
+
+def scene_outputs(name: str, package: str = __package__) -> dict[str, bytes]:
+    """Outputs of a synthetic scene, from this exporter or from the one in package, which only gets default options."""
+    bpy = install_stubs()
+    export_pac, export_pmo, export_skel = (importlib.import_module(f'{package}.{module}') for module in ("export_pac", "export_pmo", "export_skel"))
+    from .containers import TMH
+    from .mesh_build import BuildOptions
+    from .model import FU_MODEL, P3RD_MODEL
+
+    objects, prepare_pmo = SCENES[name]()
+    set_scene(bpy, objects)
+    root = next(obj for obj in objects if obj.type == "EMPTY" and obj.parent is None)
+    variants = (("", {}),) if package != __package__ else (("", {}), ("_optimized", {"options": BuildOptions(**OPTIMIZED)}))
+
+    outputs = {}
+    for tag, version in VERSIONS:
+        ver = P3RD_MODEL if version == "1.2" else FU_MODEL
+        for variant, options in variants:
+            pmo, _ = export_pmo.export(ver, "scene", prepare_pmo, **options)
+            f = BytesIO()
+            pmo.save(f)
+            outputs[f'{name}_{tag}{variant}.pmo'] = f.getvalue()
+
+        f = BytesIO()
+        writer = export_skel.export_p3rd_skel if ver == P3RD_MODEL else export_skel.export_fu_skel
+        writer(export_skel.bonesFromEmpties(root), f)
+        outputs[f'{name}_{tag}.ahi'] = f.getvalue()
+
+        tmh = TMH()
+        for node in textures_of(objects):
+            tmh.loadImg(node)
+        f = BytesIO()
+        tmh.buildTMH(f)
+        outputs[f'{name}_{tag}.tmh'] = f.getvalue()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "out.pac")
+            export_pac.export(bpy.context, path, version, "scene", prepare_pmo)
+            outputs[f'{name}_{tag}.pac'] = Path(path).read_bytes()
+    return outputs
+
+
+def reference_outputs(directory: str) -> dict[str, bytes]:
+    """Default option outputs of the exporter checked out in directory, for the scenes whose prepare PMO mode it
+    runs the same way, "none". Its package __init__ registers the add-on, so only its modules are loaded."""
+    package = types.ModuleType("golden_reference")
+    package.__path__ = [os.path.abspath(directory)]
+    sys.modules[package.__name__] = package
+    outputs = {}
+    with redirect_stdout(StringIO()):
+        for name, scene in SCENES.items():
+            if scene()[1] == "none":
+                outputs.update(scene_outputs(name, package.__name__))
+    return outputs
+
+
+def reference_names() -> set[str]:
+    path = GOLDEN_DIR / "REFERENCE"
+    if not path.exists():
+        return set()
+    return {line for line in path.read_text().splitlines() if line and not line.startswith("#")}
+
+
+def input_outputs(path: Path) -> dict[str, bytes]:
+    from . import intermediate
+    from .compiler import build_pac, compile_pmo
+    from .containers import TMH
+
+    data = intermediate.load(str(path))
+    pmo = compile_pmo(data)
+    f = BytesIO()
+    pmo.save(f)
+    outputs = {f'{path.stem}_compiled.pmo': f.getvalue()}
+    if data.bones is not None:
+        tmh = TMH()
+        for pixels, width, height in data.textures:
+            tmh.loadPixels(pixels.tolist(), width, height)
+        pac = build_pac(compile_pmo(data), data.bones, tmh)
+        with tempfile.TemporaryDirectory() as directory:
+            pac.save(os.path.join(directory, "out.pac"))
+            outputs[f'{path.stem}_compiled.pac'] = Path(directory, "out.pac").read_bytes()
+    return outputs
+
+
+def all_outputs() -> dict[str, bytes]:
+    outputs = {}
+    # exporters print their progress, only the harness' own report should show up
+    with redirect_stdout(StringIO()):
+        for name in SCENES:
+            outputs.update(scene_outputs(name))
+        for path in sorted(INPUT_DIR.glob("*.npz")):
+            outputs.update(input_outputs(path))
+    return outputs
+
+
+def capture() -> list[Path]:
+    """Write every synthetic scene as an intermediate file, the way the Blender intermediate exporter does."""
+    bpy = install_stubs()
+    from . import export_skel, intermediate
+    from .export_pmo import SceneReader, read_targets
+    from .model import FU_MODEL, P3RD_MODEL
+
+    INPUT_DIR.mkdir(parents=True, exist_ok=True)
+    paths = []
+    with redirect_stdout(StringIO()):
+        for name, scene in SCENES.items():
+            objects, prepare_pmo = scene()
+            set_scene(bpy, objects)
+            for tag, version in VERSIONS:
+                data = intermediate.Intermediate()
+                data.pmo_ver = P3RD_MODEL if version == "1.2" else FU_MODEL
+                reader = SceneReader(prepare_pmo, get_textures=True)
+                data.objects = [reader.read(obj) for obj in read_targets("scene", reader)]
+                data.materials = reader.pmo_mats
+                data.bones = export_skel.bonesFromEmpties(next(obj for obj in objects if obj.type == "EMPTY" and obj.parent is None))
+                for texture in reader.textures:
+                    data.textures.append((np.asarray(texture.image.pixels, dtype=np.float32), *texture.image.size))
+                path = INPUT_DIR / f'{name}_{tag}.npz'
+                intermediate.save(str(path), data)
+                paths.append(path)
+    return paths
+
+
+# structural diffs
+
+PMO_FIELDS = (("filesize", "I", 0x08), ("clipping distance", "f", 0x0C), ("mesh headers", "H", 0x1C), ("materials", "H", 0x1E),
+              ("mesh header offset", "I", 0x20), ("tristrip header offset", "I", 0x24), ("material remap offset", "I", 0x28),
+              ("bone data offset", "I", 0x2C), ("material offset", "I", 0x30), ("mesh data offset", "I", 0x34))
+
+
+def pmo_regions(data: bytes) -> list[tuple[int, int, str]]:
+    p3rd = data[4:8] == b'102\x00'
+    header_size, count_at = (0x30, 0x2C) if p3rd else (0x18, 0x14)
+    mesh_count, material_count = unpack_from("2H", data, 0x1C)
+    mesh_header, tristrip_header, remap, bone_data, materials, mesh_data = unpack_from("6I", data, 0x20)
+
+    regions = [(0, 0x40, "header")]
+    tristrips = 0
+    for index in range(mesh_count):
+        start = mesh_header + header_size * index
+        regions.append((start, start + header_size, f'mesh header {index}'))
+        tristrips += unpack_from("H", data, start + count_at)[0]
+    submeshes = []
+    for index in range(tristrips):
+        start = tristrip_header + 0x10 * index
+        regions.append((start, start + 0x10, f'tristrip header {index}'))
+        submeshes.append((index, *unpack_from("3I", data, start + 4)))
+    if remap:
+        regions.append((remap, bone_data, "material remap"))
+    regions.append((bone_data, materials, "bone data"))
+    for index in range(material_count):
+        regions.append((materials + 0x10 * index, materials + 0x10 * (index + 1), f'material {index}'))
+
+    submeshes.sort(key=lambda sub: sub[1])
+    for number, (index, mesh, vertex, index_data) in enumerate(submeshes):
+        end = mesh_data + submeshes[number + 1][1] if number + 1 < len(submeshes) else len(data)
+        parts = sorted(((mesh, "display list"), (vertex, "vertices"), *([(index_data, "indices")] if index_data else [])))
+        for (start, part), (stop, _) in zip(parts, parts[1:] + [(end - mesh_data, None)]):
+            if mesh_data + start < end:
+                regions.append((mesh_data + start, min(end, mesh_data + stop), f'submesh {index} {part}'))
+    return regions
+
+
+def ahi_regions(data: bytes) -> list[tuple[int, int, str]]:
+    bone_size = 0x5C if data[:4] == b'\x00\x00\x00\x80' else 0x48 + 12 + 4 * 46
+    count, = unpack_from("I", data, 4)
+    roots, = unpack_from("I", data, 0x10)
+    start = 0x18 + 4 * roots
+    regions = [(0, start, "skeleton header")]
+    for bone in range(count - 1):
+        regions.append((start + bone_size * bone, start + bone_size * (bone + 1), f'bone {bone}'))
+    return regions
+
+
+def tmh_regions(data: bytes) -> list[tuple[int, int, str]]:
+    count, = unpack_from("I", data, 8)
+    regions, start = [(0, 0x10, "TMH header")], 0x10
+    for image in range(count):
+        size, = unpack_from("i", data, start)
+        data_size, = unpack_from("i", data, start + 0x10)
+        regions += [(start, start + 0x20, f'image {image} header'),
+                    (start + 0x20, start + 0x10 + data_size, f'image {image} pixels'),
+                    (start + 0x10 + data_size, start + size, f'image {image} palette')]
+        start += size
+    return regions
+
+
+def pac_entries(data: bytes) -> list[tuple[int, int]]:
+    count, = unpack_from("I", data, 0)
+    return [unpack_from("2I", data, 4 + 8 * index) for index in range(count)]
+
+
+def pac_regions(data: bytes) -> list[tuple[int, int, str]]:
+    entries = pac_entries(data)
+    return [(0, 4 + 8 * len(entries), "PAC table")] + [(offset, offset + length, f'PAC file {index}') for index, (offset, length) in enumerate(entries)]
+
+
+REGIONS = {".pmo": pmo_regions, ".ahi": ahi_regions, ".tmh": tmh_regions, ".pac": pac_regions}
+PAC_KINDS = (".pmo", ".ahi", ".tmh", ".bin")
+
+
+def regions_of(kind: str, data: bytes) -> list[tuple[int, int, str]]:
+    try:
+        return REGIONS[kind](data) if kind in REGIONS else []
+    except (StructError, IndexError):
+        return []  # too broken to parse, the byte offsets will have to do
+
+
+def structural_diff(kind: str, golden: bytes, current: bytes, indent: str = "\t") -> list[str]:
+    lines = []
+    if len(golden) != len(current):
+        lines.append(f'{indent}size {len(golden)} -> {len(current)}')
+
+    if kind == ".pmo":
+        for field, fmt, offset in PMO_FIELDS:
+            try:
+                old, new = unpack_from(fmt, golden, offset)[0], unpack_from(fmt, current, offset)[0]
+            except StructError:
+                break
+            if old != new:
+                lines.append(f'{indent}{field}: {old} -> {new}')
+
+    length = min(len(golden), len(current))
+    first = next((offset for offset in range(length) if golden[offset] != current[offset]), None)
+    if first is None:
+        return lines
+
+    regions = regions_of(kind, golden)
+    differing = [label for start, end, label in regions
+                 if start < length and golden[start:min(end, length)] != current[start:min(end, length)]]
+    where = next((label for start, end, label in regions if start <= first < end), "unmapped bytes")
+    lines.append(f'{indent}first difference at {hex(first)} in {where}: {golden[first:first+8].hex()} -> {current[first:first+8].hex()}')
+    if differing:
+        lines.append(f'{indent}differing: {", ".join(differing[:12])}{", ..." if len(differing) > 12 else ""}')
+
+    if kind == ".pac":
+        try:
+            old_entries, new_entries = pac_entries(golden), pac_entries(current)
+        except StructError:
+            return lines
+        for index, ((old_offset, old_length), (new_offset, new_length)) in enumerate(zip(old_entries, new_entries)):
+            old, new = golden[old_offset:old_offset+old_length], current[new_offset:new_offset+new_length]
+            if old != new:
+                entry_kind = PAC_KINDS[min(index, len(PAC_KINDS) - 1)]
+                lines.append(f'{indent}PAC file {index} ({entry_kind}):')
+                lines.extend(structural_diff(entry_kind, old, new, indent + "\t"))
+    return lines
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pmo_export.golden", description="Check exporter output against golden files.")
+    parser.add_argument("--update", action="store_true", help="Write the current outputs as the golden files")
+    parser.add_argument("--capture", action="store_true", help="Write the synthetic scenes to golden/inputs as intermediate files")
+    parser.add_argument("--reference", metavar="DIR", help="Write the default option outputs of the exporter checked out in DIR "
+                                                           "as reference golden files, --update leaves them alone")
+    args = parser.parse_args(argv)
+
+    if args.reference:
+        outputs = reference_outputs(args.reference)
+        GOLDEN_DIR.mkdir(exist_ok=True)
+        for name, data in outputs.items():
+            (GOLDEN_DIR / name).write_bytes(data)
+        (GOLDEN_DIR / "REFERENCE").write_text(f'# written by --reference, every other golden file is a snapshot of --update\n'
+                                              + "".join(f'{name}\n' for name in sorted(outputs)))
+        print(f'Wrote {len(outputs)} reference golden files')
+        return 0
+
+    if args.capture:
+        for path in capture():
+            print(f'Captured {path.relative_to(GOLDEN_DIR.parent)}')
+
+    outputs = all_outputs()
+
+    references = reference_names()
+    if args.update:
+        GOLDEN_DIR.mkdir(exist_ok=True)
+        snapshots = {name: data for name, data in outputs.items() if name not in references}
+        for name, data in snapshots.items():
+            (GOLDEN_DIR / name).write_bytes(data)
+        print(f'Wrote {len(snapshots)} golden files, {len(outputs) - len(snapshots)} reference files left as they were')
+        return 0
+
+    failures = 0
+    for name, data in outputs.items():
+        path = GOLDEN_DIR / name
+        if not path.exists():
+            print(f'MISSING {name}, run with --update to add it')
+            failures += 1
+            continue
+        golden = path.read_bytes()
+        kind = "reference" if name in references else "snapshot"
+        if golden == data:
+            print(f'ok      {name} ({kind})')
+            continue
+        failures += 1
+        print(f'FAILED  {name} ({kind})')
+        for line in structural_diff(path.suffix, golden, data):
+            print(line)
+
+    print(f'{len(outputs) - failures} of {len(outputs)} outputs match')
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+"""
+Intermediate .npz files, written from Blender and compiled into PMO/PAC files by compiler.py.
+
+Every array of an object's MeshArrays is stored as objects/<index>/<field>, materials as
+materials/<field>, texture pixels as textures/<index> and everything else is kept as JSON in meta.
+"""
+import json
+
+import numpy as np
+
+from . import model as pmodel
+from .export_skel import PMOBone
+from .mesh_arrays import MeshArrays
+
+FORMAT_VERSION = 1
+
+ARRAY_FIELDS = ("positions", "uvs", "normals", "weights", "members", "faces", "face_keys")
+META_FIELDS = ("name", "labels", "bone_ids", "multiple_normals", "material_count", "alpha_blending_params", "ld_at_factor_c")
+
+
+class IntermediateError(Exception):
+    ...
+
+
+class Intermediate:
+    def __init__(self) -> None:
+        self.pmo_ver: bytes = pmodel.P3RD_MODEL
+        self.objects: list[MeshArrays] = []
+        self.materials: list[tuple[int, pmodel.Material]] = []
+        self.textures: list[tuple[np.ndarray, int, int]] = []  # (pixels, width, height)
+        self.bones: dict[int, PMOBone] | None = None
+        self.hard_tristripification: bool = False
+        self.use_mat_remaps: bool = False
+
+
+def save(path: str, data: Intermediate) -> None:
+    arrays = {}
+    meta = {
+        "format": FORMAT_VERSION,
+        "pmo_ver": data.pmo_ver.hex(),
+        "hard_tristripification": data.hard_tristripification,
+        "use_mat_remaps": data.use_mat_remaps,
+        "objects": [],
+        "textures": [],
+        "bones": None if data.bones is None else [vars(bone) for bone in data.bones.values()],
+    }
+
+    for index, obj in enumerate(data.objects):
+        meta["objects"].append({field: getattr(obj, field) for field in META_FIELDS})
+        for field in ARRAY_FIELDS:
+            arrays[f'objects/{index}/{field}'] = getattr(obj, field)
+
+    arrays["materials/ids"] = np.array([mat_id for mat_id, _ in data.materials], dtype=np.int64)
+    arrays["materials/diffuse"] = np.array([list(mat.diffuse.values()) for _, mat in data.materials], dtype=np.float64).reshape(-1, 4)
+    arrays["materials/ambient"] = np.array([list(mat.ambient.values()) for _, mat in data.materials], dtype=np.float64).reshape(-1, 4)
+    arrays["materials/texture"] = np.array([mat.textureIndex for _, mat in data.materials], dtype=np.int64)
+
+    for index, (pixels, width, height) in enumerate(data.textures):
+        meta["textures"].append({"width": width, "height": height})
+        arrays[f'textures/{index}'] = np.asarray(pixels, dtype=np.float32)
+
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+    with open(path, "wb") as file:
+        np.savez_compressed(file, **arrays)
+
+
+def load(path: str) -> Intermediate:
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = json.loads(arrays["meta"].tobytes().decode("utf-8"))
+        if meta["format"] != FORMAT_VERSION:
+            raise IntermediateError(f'Unsupported intermediate format version {meta["format"]}.')
+
+        data = Intermediate()
+        data.pmo_ver = bytes.fromhex(meta["pmo_ver"])
+        data.hard_tristripification = meta["hard_tristripification"]
+        data.use_mat_remaps = meta["use_mat_remaps"]
+
+        for index, fields in enumerate(meta["objects"]):
+            obj = MeshArrays()
+            for field, value in fields.items():
+                setattr(obj, field, value)
+            for field in ARRAY_FIELDS:
+                setattr(obj, field, arrays[f'objects/{index}/{field}'])
+            data.objects.append(obj)
+
+        for mat_id, diffuse, ambient, texture in zip(arrays["materials/ids"].tolist(), arrays["materials/diffuse"].tolist(),
+                                                     arrays["materials/ambient"].tolist(), arrays["materials/texture"].tolist()):
+            mat = pmodel.Material()
+            mat.diffuse = dict(zip("rgba", diffuse))
+            mat.ambient = dict(zip("rgba", ambient))
+            mat.textureIndex = texture
+            data.materials.append((mat_id, mat))
+
+        for index, size in enumerate(meta["textures"]):
+            data.textures.append((arrays[f'textures/{index}'], size["width"], size["height"]))
+
+        if meta["bones"] is not None:
+            data.bones = {}
+            for index, fields in enumerate(meta["bones"]):
+                bone = PMOBone()
+                bone.__dict__.update({k: tuple(v) if isinstance(v, list) else v for k, v in fields.items()})
+                data.bones[index] = bone
+
+    return data
@@ -0,0 +1,168 @@
+import bpy
+import numpy as np
+from bpy_extras.io_utils import ExportHelper
+from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.types import Operator
+
+from . import export_skel
+from . import intermediate
+from .export_pmo import SceneReader, PmoExportError, read_targets, warning
+
+
+FU_MODEL = b'1.0\x00'
+P3RD_MODEL = b'102\x00'
+
+def export(context, filepath: str, version: str, target: str = 'scene', prepare_pmo: str = "none", cleanup_vg: bool = False, apply_modifiers: bool = False,
+           hard_tristripification: bool = False, do_fix_vg: bool = False, use_mat_remaps: bool = False, include_pac: bool = False):
+    data = intermediate.Intermediate()
+    data.pmo_ver = P3RD_MODEL if version == "1.2" else FU_MODEL
+    data.hard_tristripification = hard_tristripification
+    data.use_mat_remaps = use_mat_remaps
+
+    reader = SceneReader(prepare_pmo, cleanup_vg, get_textures=include_pac, apply_modifiers=apply_modifiers, do_fix_vg=do_fix_vg)
+    try:
+        objs = read_targets(target, reader)
+        if objs is None:
+            return {'CANCELLED'}
+        data.objects = [reader.read(obj) for obj in objs]
+    except PmoExportError as e:
+        warning(e.args, "Error")
+        return {'CANCELLED'}
+    data.materials = reader.pmo_mats
+
+    if include_pac:
+        skeletons = [obj for obj in bpy.data.objects if obj.type == "EMPTY" and not obj.parent]
+        if len(skeletons) == 0:
+            warning(["Scene doesn't contain a valid skeleton."], "Error")
+            return {'CANCELLED'}
+        data.bones = export_skel.bonesFromEmpties(skeletons[0])
+
+        for texture in reader.textures:
+            pixels = np.empty(len(texture.image.pixels), dtype=np.float32)
+            texture.image.pixels.foreach_get(pixels)
+            data.textures.append((pixels, *texture.image.size))
+
+    intermediate.save(filepath, data)
+
+    if reader.warnings:
+        warning(reader.warnings)
+
+    return {'FINISHED'}
+
+
+class ExportIntermediate(Operator, ExportHelper):
+    """Export meshes, materials and (optionally) skeleton and textures for the standalone PMO/PAC compiler."""
+    bl_idname = "export_mh.pmo_intermediate"
+    bl_label = "Export PMO Intermediate"
+
+    filename_ext = ".npz"
+
+    filter_glob: StringProperty(
+        default="*.npz",
+        options={'HIDDEN'},
+        maxlen=255,  # Max internal buffer length, longer would be clamped.
+    )
+
+    type: EnumProperty(
+        name="Format Version",
+        description="Choose pmo format version",
+        items=(
+            ('1.0', "MHFU", "Export MHFU models"),
+            ('1.2', "MHP3rd", "Export MHP3rd models"),
+        ),
+        default='1.2',
+    )
+
+    export_target: EnumProperty(
+        name="Export target",
+        description="Select target for exporting",
+        items=(
+            ("scene", "Scene", "Export all mesh objects in the scene"),
+            ("visible", "Visible", "Export all visible mesh objects"),
+            ("selection", "Selection", "Export all selected mesh objects"),
+            ("active", "Active", "Export active mesh object")
+        ),
+        default="visible",
+    )
+
+    prep_pmo: EnumProperty(
+        name="Prepare PMO",
+        description="Triangulate mesh and split vertex for normals/uvs. (Same as pressing 'Prepare PMO' but won't have a permanent effect on the model)",
+        items=(
+            ("none", "None", "Do not run any prep script"),
+            ("simple", "Simple", "Just split seams and sharp edges"),
+            ("*&", "*&'s", "Run *&'s script"),
+            ("xenthos", "Xenthos'", "Run Xenthos' script"),
+            ("fast", "Fast", "Split vertices by UV and normal while reading the mesh, without modifying it"),
+        ),
+        default="simple"
+    )
+
+    cleanup_vg: BoolProperty(
+        name="Clean Up VG",
+        description="Remove vertex group assignments wich are not required",
+        default=False
+    )
+
+    do_fix_vg: BoolProperty(
+        name="Merge Submeshes",
+        description="Attempts to reduce submeshes by merging them based on material and bones",
+        default=False
+    )
+
+    use_mat_remaps: BoolProperty(
+        name="Save Material Remap Data",
+        description="Save Material Remap Data (Always on for FU)",
+        default=False
+    )
+
+    apply_modifiers: BoolProperty(
+        name="Apply Modifiers",
+        description="Apply modifiers before exporting",
+        default=False
+    )
+
+    hard_tristripification: BoolProperty(
+        name="Hard Tristripification",
+        description="Create as few tristrips as possible",
+        default=False
+    )
+
+    include_pac: BoolProperty(
+        name="Include PAC Data",
+        description="Also save the skeleton and textures, so the file can be compiled into a PAC",
+        default=False
+    )
+
+    def execute(self, context):
+        return export(
+            context,
+            filepath=self.filepath,
+            version=self.type,
+            target=self.export_target,
+            prepare_pmo=self.prep_pmo,
+            cleanup_vg=self.cleanup_vg,
+            apply_modifiers=self.apply_modifiers,
+            hard_tristripification=self.hard_tristripification,
+            do_fix_vg=self.do_fix_vg,
+            use_mat_remaps=self.use_mat_remaps,
+            include_pac=self.include_pac
+        )
+
+
+def menu_func_export(self, context):
+    self.layout.operator(ExportIntermediate.bl_idname, text="PSP MH PMO Intermediate")
+
+
+def register():
+    bpy.utils.register_class(ExportIntermediate)
+    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+
+
+def unregister():
+    bpy.utils.unregister_class(ExportIntermediate)
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+
+
+if __name__ == "__main__":
+    register()
@@ -0,0 +1,274 @@
+import hashlib
+
+import numpy as np
+
+
+ATTRIBUTE_DTYPES = {
+    "FLOAT": np.float32,
+    "INT": np.int32,
+    "INT8": np.int8,
+    "BOOLEAN": np.bool_,
+}
+
+
+class MeshArrays:
+    """Plain array snapshot of a mesh, everything the PMO builder needs after leaving Blender."""
+    def __init__(self) -> None:
+        self.name: str = ""
+        self.positions: np.ndarray = np.zeros((0, 3), dtype=np.float32)
+        self.uvs: np.ndarray = np.zeros((0, 2), dtype=np.float32)
+        self.normals: np.ndarray = np.zeros((0, 3), dtype=np.float32)
+        self.weights: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self.members: np.ndarray = np.zeros((0, 0), dtype=np.bool_)
+        self.faces: np.ndarray = np.zeros((0, 3), dtype=np.int64)
+        self.face_keys: np.ndarray = np.zeros(0, dtype=[("material", np.int64)])
+        self.labels: list[str] = []
+        self.bone_ids: list[int | None] = []
+        self.multiple_normals: bool = False
+
+        self.material_count: int = 0
+        self.alpha_blending_params: int | None = None
+        self.ld_at_factor_c: int | None = None
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.positions)
+
+    @property
+    def unweighted(self) -> bool:
+        return bool(len(self.members)) and not self.members.any(axis=1).all()
+
+    def clean_weights(self, limit: float = 0.0) -> None:
+        """Drop vertex group assignments with a weight at or below limit, like vertex_group_clean."""
+        self.members &= self.weights > limit
+        self.weights[~self.members] = 0.0
+
+    def prune_weights(self, threshold: float = 0.0, max_influences: int = 0) -> None:
+        """Drop influences below threshold and all but the max_influences largest ones (0 keeps them all).
+
+        Every vertex keeps its largest influence, and vertices that lost some are rescaled to their
+        previous weight total. New arrays are assigned, so shallow copies keep the original weights.
+        """
+        if not self.weights.size:
+            return
+        weights = np.where(self.members, self.weights, 0.0)
+        keep = self.members & (weights >= threshold)
+        if 0 < max_influences < weights.shape[1]:
+            strongest = np.argsort(-weights, axis=1, kind="stable")[:, :max_influences]
+            top = np.zeros_like(keep)
+            np.put_along_axis(top, strongest, True, axis=1)
+            keep &= top
+        rows = np.arange(len(weights))
+        largest = weights.argmax(axis=1)
+        keep[rows, largest] |= self.members[rows, largest]
+
+        pruned = np.where(keep, weights, 0.0)
+        before, after = weights.sum(axis=1), pruned.sum(axis=1)
+        factor = np.divide(before, after, out=np.ones_like(before), where=(after > 0) & (keep != self.members).any(axis=1))
+        self.weights = (pruned * factor[:, None]).astype(self.weights.dtype)
+        self.members = keep
+
+    def reorder(self, order: np.ndarray) -> None:
+        remap = np.empty_like(order)
+        remap[order] = np.arange(len(order))
+        self.positions = self.positions[order]
+        self.uvs = self.uvs[order]
+        self.normals = self.normals[order]
+        self.weights = self.weights[order]
+        self.members = self.members[order]
+        self.faces = remap[self.faces]
+
+
+def bone_id(name: str) -> int | None:
+    try:
+        return int(name.split(".")[-1])
+    except ValueError:
+        return None
+
+
+def read_face_keys(mesh, mat_ids: np.ndarray) -> tuple[np.ndarray, list[str]]:
+    face_count = len(mesh.polygons)
+    metalayers = [layer for layer in mesh.attributes if "PMO " in layer.name]
+    labels = [layer.name.replace("PMO ", "") for layer in metalayers]
+
+    material_index = np.empty(face_count, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_index)
+
+    keys = np.empty(face_count, dtype=[("material", np.int64)] +
+                    [(f'f{idx}', ATTRIBUTE_DTYPES.get(layer.data_type, np.float32)) for idx, layer in enumerate(metalayers)])
+    keys["material"] = mat_ids[material_index]
+    for idx, layer in enumerate(metalayers):
+        values = np.empty(face_count, dtype=keys.dtype[f'f{idx}'])
+        layer.data.foreach_get("value", values)
+        keys[f'f{idx}'] = values
+
+    return keys, labels
+
+
+def read_groups(mesh, group_count: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vertex group elements as flat (vertex, group, weight) arrays, each vertex's read with foreach_get."""
+    counts = np.zeros(len(mesh.vertices), dtype=np.int64)
+    groups = np.empty(len(mesh.vertices) * group_count, dtype=np.int32)
+    weights = np.empty(len(mesh.vertices) * group_count, dtype=np.float32)
+    end = 0
+    for index, vert in enumerate(mesh.vertices):
+        elements = vert.groups
+        count = len(elements)
+        elements.foreach_get("group", groups[end:end + count])
+        elements.foreach_get("weight", weights[end:end + count])
+        counts[index] = count
+        end += count
+    vertices = np.repeat(np.arange(len(mesh.vertices)), counts)
+    keep = groups[:end] < group_count
+    return vertices[keep], groups[:end][keep], weights[:end][keep]
+
+
+def read_weights(vertices: np.ndarray, groups: np.ndarray, values: np.ndarray, vertex_count: int,
+                 group_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Weight and membership matrices from read_groups' arrays."""
+    weights = np.zeros((vertex_count, group_count), dtype=np.float32)
+    members = np.zeros((vertex_count, group_count), dtype=np.bool_)
+    members[vertices, groups] = True
+    weights[vertices, groups] = values
+    return weights, members
+
+
+def split_groups(source: np.ndarray, vertices: np.ndarray, groups: np.ndarray, vertex_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """read_groups' vertex and group arrays for vertices split from source, in the same element order."""
+    counts = np.bincount(vertices, minlength=vertex_count)
+    starts = np.cumsum(counts) - counts
+    split_counts = counts[source]
+    split_vertices = np.repeat(np.arange(len(source)), split_counts)
+    offsets = np.arange(len(split_vertices)) - np.repeat(np.cumsum(split_counts) - split_counts, split_counts)
+    return split_vertices, groups[np.repeat(starts[source], split_counts) + offsets]
+
+
+def sort_order(faces: np.ndarray, face_slots: np.ndarray, slot_count: int, vertices: np.ndarray, groups: np.ndarray,
+               vertex_count: int) -> np.ndarray:
+    """Vertex order export_pmo.sort_vertices gives a mesh with these faces and group elements.
+
+    Slot by slot, the slot's vertices are taken in the order of a set filled from its faces and listed under each of
+    their groups, groups in the order they're first met. Vertices get increasing bmesh indices in that order, the last
+    one a vertex gets wins, and bmesh sorts by them. Vertices it doesn't reach keep their own index.
+    """
+    index = np.full(vertex_count, -1, dtype=np.int64)
+    assigned = 0
+    for slot in range(slot_count):
+        slot_vertices = np.fromiter(set(faces[face_slots == slot].ravel().tolist()), dtype=np.int64)
+        position = np.full(vertex_count, -1, dtype=np.int64)
+        position[slot_vertices] = np.arange(len(slot_vertices))
+
+        rows = np.flatnonzero(position[vertices] >= 0)
+        rows = rows[np.argsort(position[vertices[rows]], kind="stable")]
+        _, first, group_rank = np.unique(groups[rows], return_index=True, return_inverse=True)
+        order = rows[np.lexsort((position[vertices[rows]], first[group_rank.ravel()]))]
+        np.maximum.at(index, vertices[order], assigned + np.arange(len(order)))
+        assigned += len(order)
+
+    index = np.where(index >= 0, index, np.arange(vertex_count))
+    return np.lexsort((np.arange(vertex_count), index))
+
+
+def read_loop_normals(mesh) -> np.ndarray:
+    if hasattr(mesh, "calc_normals_split"):  # computed on demand since 4.1
+        mesh.calc_normals_split()
+    normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+    mesh.loops.foreach_get("normal", normals)
+    return normals.reshape(-1, 3)
+
+
+def source_hash(mesh, vertex_groups, mat_ids: np.ndarray, *extra, groups: tuple | None = None) -> str:
+    """Hash of everything from_mesh and the prep scripts read from a mesh, plus any extra export options.
+
+    groups are read_groups' arrays for the mesh when they've been read already.
+    """
+    digest = hashlib.sha256()
+    for collection, prop, dtype, size in ((mesh.vertices, "co", np.float32, 3),
+                                          (mesh.loops, "vertex_index", np.int32, 1),
+                                          (mesh.polygons, "loop_start", np.int32, 1),
+                                          (mesh.polygons, "use_smooth", np.bool_, 1),
+                                          (mesh.edges, "vertices", np.int32, 2),
+                                          (mesh.edges, "use_seam", np.bool_, 1),
+                                          (mesh.edges, "use_edge_sharp", np.bool_, 1),
+                                          (mesh.uv_layers.active.data, "uv", np.float32, 2)):
+        values = np.empty(len(collection) * size, dtype=dtype)
+        collection.foreach_get(prop, values)
+        digest.update(values.tobytes())
+
+    face_keys, labels = read_face_keys(mesh, mat_ids)
+    digest.update(face_keys.tobytes())
+    digest.update(read_loop_normals(mesh).tobytes())
+    for array in groups or read_groups(mesh, len(vertex_groups)):
+        digest.update(array.tobytes())
+    digest.update(repr((labels, [vg.name for vg in vertex_groups], [mat.name for mat in mesh.materials], extra)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def from_mesh(mesh, vertex_groups, mat_ids: np.ndarray, split: bool = False, groups: tuple | None = None) -> MeshArrays:
+    """Read a triangulated mesh into arrays.
+
+    With split, faces come from the loop triangulation and every unique (vertex, UV, loop normal)
+    combination becomes its own vertex, which is what the prepare PMO scripts do with operators.
+    groups are read_groups' arrays for the mesh when they've been read already.
+    """
+    arrays = MeshArrays()
+    arrays.material_count = len(mesh.materials)
+    arrays.bone_ids = [bone_id(vg.name) for vg in vertex_groups]
+    arrays.face_keys, arrays.labels = read_face_keys(mesh, mat_ids)
+
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+    positions = positions.reshape(-1, 3)
+
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+
+    loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    mesh.uv_layers.active.data.foreach_get("uv", loop_uvs)
+    loop_uvs = loop_uvs.reshape(-1, 2)
+
+    loop_normals = read_loop_normals(mesh)
+    group_vertices, groups, values = groups or read_groups(mesh, len(vertex_groups))
+    weights, members = read_weights(group_vertices, groups, values, len(positions), len(vertex_groups))
+    face_slots = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get("material_index", face_slots)
+
+    if split:
+        mesh.calc_loop_triangles()
+        tri_loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+        mesh.loop_triangles.foreach_get("loops", tri_loops)
+        tri_faces = np.empty(len(mesh.loop_triangles), dtype=np.int64)
+        mesh.loop_triangles.foreach_get("polygon_index", tri_faces)
+
+        loop_keys = np.column_stack((loop_verts.astype(np.float64), loop_uvs, loop_normals))
+        _, first_loop, loop_remap = np.unique(loop_keys, axis=0, return_index=True, return_inverse=True)
+        source = loop_verts[first_loop]
+
+        arrays.positions = positions[source]
+        arrays.uvs = loop_uvs[first_loop]
+        arrays.normals = loop_normals[first_loop]
+        arrays.weights = weights[source]
+        arrays.members = members[source]
+        arrays.faces = loop_remap.ravel()[tri_loops].reshape(-1, 3)
+        arrays.face_keys = arrays.face_keys[tri_faces]
+        face_slots = face_slots[tri_faces]
+        group_vertices, groups = split_groups(source, group_vertices, groups, len(positions))
+    else:
+        loop_start = np.empty(len(mesh.polygons), dtype=np.int64)
+        mesh.polygons.foreach_get("loop_start", loop_start)
+
+        _, first_loop = np.unique(loop_verts, return_index=True)
+        vertex_loop = np.zeros(len(positions), dtype=np.int64)
+        vertex_loop[loop_verts[first_loop]] = first_loop
+
+        arrays.positions = positions
+        arrays.uvs = loop_uvs[vertex_loop]
+        arrays.normals = loop_normals[vertex_loop]
+        arrays.weights = weights
+        arrays.members = members
+        arrays.faces = loop_verts[(loop_start[:, None] + np.arange(3)).ravel()].reshape(-1, 3)
+        arrays.multiple_normals = bool((loop_normals != arrays.normals[loop_verts]).any())
+
+    # the order the prepared copies get from export_pmo.sort_vertices
+    arrays.reorder(sort_order(arrays.faces, face_slots, len(mesh.materials), group_vertices, groups, arrays.vertex_count))
+    return arrays
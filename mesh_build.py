@@ -0,0 +1,555 @@
+import copy
+import dataclasses
+import struct
+import warnings
+from dataclasses import dataclass, fields
+
+import numpy as np
+from pyffi.utils import trianglestripifier
+
+from . import model as pmodel
+from .mesh_arrays import MeshArrays
+from .profiling import span
+
+
+class PmoExportError(Exception):
+    ...
+
+
+@dataclass(frozen=True)
+class BuildOptions:
+    """How submeshes are built and laid out, shared by the exporters, the compiler and the cache keys."""
+    # build_mesh_header
+    hard_tristripification: bool = False
+    use_lists: bool = False
+    fit_indices: bool = False
+    weight_threshold: float = 0.0
+    max_influences: int = 0
+    # build_pmo
+    use_mat_remaps: bool = False
+    elide_states: bool = False
+    sort_submeshes: bool = False
+    vertex_tolerances: tuple[float, float, float] | None = None
+    local_scales: bool = False
+    merge_objects: bool = False
+    share_vertices: bool = False
+    intern_tables: bool = False
+
+    @property
+    def mesh_key(self) -> tuple:
+        """The options a built mesh header depends on, for cache keys."""
+        return (self.hard_tristripification, self.use_lists, self.fit_indices, self.weight_threshold, self.max_influences)
+
+
+def split_options(kwargs: dict) -> tuple[BuildOptions, dict]:
+    """BuildOptions from the keyword arguments named like its fields, and the rest of them."""
+    names = {field.name for field in fields(BuildOptions)}
+    build = {name: value for name, value in kwargs.items() if name in names}
+    if build.get("vertex_tolerances") is not None:
+        build["vertex_tolerances"] = tuple(build["vertex_tolerances"])  # lists when they come from JSON
+    return BuildOptions(**build), {name: value for name, value in kwargs.items() if name not in names}
+
+
+def apply_flat_options(options: BuildOptions, flat: dict) -> BuildOptions:
+    """options with the BuildOptions fields the exporters used to take as keyword arguments on top, None ones left out.
+
+    Those keywords are deprecated, they're only kept so calls from before BuildOptions keep working.
+    """
+    flat = {name: value for name, value in flat.items() if value is not None}
+    if not flat:
+        return options
+    build, rest = split_options(flat)
+    if rest:
+        raise TypeError(f'Unexpected keyword arguments: {", ".join(rest)}')
+    warnings.warn(f'Export keyword arguments {", ".join(flat)} are deprecated, pass options=BuildOptions(...) instead',
+                  DeprecationWarning, stacklevel=3)
+    return dataclasses.replace(options, **{name: getattr(build, name) for name in flat})
+
+
+def group_faces(arrays: MeshArrays) -> dict[tuple, np.ndarray]:
+    """Group faces by material id and PMO attribute layers with a single structured np.unique pass."""
+    unique_keys, inverse, counts = np.unique(arrays.face_keys, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse.ravel(), kind="stable")
+
+    return {key.item(): arrays.faces[group] for key, group in zip(unique_keys, np.split(order, np.cumsum(counts)[:-1]))}
+
+
+def stripify(faces: np.ndarray) -> list[list[int]]:
+    try:
+        with span("stripify"):
+            me = trianglestripifier.Mesh(faces=faces.tolist())
+            tristripifier = trianglestripifier.TriangleStripifier(me)
+            return tristripifier.find_all_strips()  # indices
+    except ValueError as e:
+        match e.args[0]:
+            case 'too many values to unpack (expected 3)':
+                raise PmoExportError("Mesh is not triangulated.")
+            case 'Degenerate face.':
+                raise PmoExportError("Mesh contains degenerate face(s).")
+            case _:
+                raise
+
+
+def partition_strips(arrays: MeshArrays, tristrips: list[list[int]]) -> dict[tuple, list[list[int]]]:
+    """Group strips by the bones of their vertices.
+
+    Palettes keep the order of a set filled vertex by vertex like the copy-based exporter did, it decides the weight
+    order of the vertices and which strips share a submesh.
+    """
+    vertex_groups = [np.flatnonzero(row).tolist() for row in arrays.members]
+    tris = {}
+    for tri in tristrips:
+        bones = set()
+        for vert in tri:
+            for group in vertex_groups[vert]:
+                if arrays.bone_ids[group] is None:
+                    raise PmoExportError("One or more bones (vertex groups) do not follow the appropriate naming conventions.")
+                bones.add((arrays.bone_ids[group], group))
+        tris.setdefault(tuple(bones), []).append(tri)
+    return tris
+
+
+def join_strips(tristrips: list[list[int]]) -> list[list[int]]:
+    stripest: list = []
+    if len(tristrips) > 1:
+        tristrips = sorted(tristrips)
+        for strip in range(len(tristrips)):
+            if len(stripest) > 0 and len(stripest) % 2 == 0:
+                stripest.append(stripest[-1])
+            if strip < len(tristrips) - 1:
+                tristrips[strip].append(tristrips[strip][-1])
+            new = [tristrips[strip][0]] if strip > 0 else []
+            new.extend(tristrips[strip])
+            stripest.extend(new)
+    else:
+        stripest = tristrips[0]
+    return [stripest]
+
+
+def strip_triangles(strip: list[int]) -> list[tuple[int, int, int]]:
+    """Triangles of a strip keeping their winding, degenerate ones are left out."""
+    faces = []
+    for i in range(len(strip) - 2):
+        a, b, c = strip[i:i+3]
+        if a == b or b == c or a == c:
+            continue
+        faces.append((b, a, c) if i % 2 else (a, b, c))
+    return faces
+
+
+def choose_primitives(tri: list[list[int]], index_size: int) -> tuple[list[list[int]], list[int]]:
+    """Split a submesh's strips into those kept as strips and one triangle list made from the rest.
+
+    Cost is index bytes plus 4 bytes per prim command, short strips go into the list when their
+    triangles cost no more than the strip did. All strips are kept if the list doesn't pay off.
+    """
+    strips, triangles = [], []
+    for strip in tri:
+        faces = strip_triangles(strip)
+        if 3 * len(faces) * index_size <= len(strip) * index_size + 4:
+            triangles.extend(faces)
+        else:
+            strips.append(strip)
+
+    strip_cost = sum(len(strip) * index_size + 4 for strip in tri)
+    mixed_cost = sum(len(strip) * index_size + 4 for strip in strips) + (3 * len(triangles) * index_size + 4 if triangles else 0)
+    if mixed_cost >= strip_cost:
+        return tri, []
+    return strips, [v for face in triangles for v in face]
+
+
+def index_format(max_index: int) -> str:
+    return "B" if max_index <= 255 else "H" if max_index <= 0xFFFF else "I"
+
+
+def split_strips(tri: list[list[int]], limit: int = 0x100) -> list[list[list[int]]]:
+    """Group consecutive strips into pieces using at most limit vertices each, strips themselves are never cut."""
+    pieces, piece, used = [], [], set()
+    for strip in tri:
+        grown = used.union(strip)
+        if piece and len(grown) > limit:
+            pieces.append(piece)
+            piece, grown = [], set(strip)
+        piece.append(strip)
+        used = grown
+    pieces.append(piece)
+    return pieces
+
+
+def index_bytes(meshes: list[pmodel.Mesh]) -> int:
+    return sum(len(index.vertices) * struct.calcsize(mesh.index_format) for mesh in meshes for index in mesh.indices)
+
+
+def mesh_cost(mesh: pmodel.Mesh) -> int:
+    """Bytes a submesh adds to the file, display list and mesh data plus its tristrip header and bone data.
+
+    Sizes only, vertices can't be encoded before PMO.fix_scales has set their UV scales.
+    """
+    return mesh.data_size + mesh.tri_header.size + len(mesh.tri_header.bone_data)
+
+
+def build_mesh(arrays: MeshArrays, props: dict, bones: tuple, tri: list[list[int]], scale: dict[str, float], use_lists: bool = False,
+               reorder: bool = False) -> pmodel.Mesh:
+    tristrip_header = pmodel.TristripHeader()
+    tristrip_header.materialOffset = props["material"]
+    tristrip_header.weightCount = len(bones)
+    tristrip_header.bones = [id for id, index in bones]
+
+    if "Bypass Transform" in props:
+        tristrip_header.bypass_transform = props["Bypass Transform"] > 0
+    if "Backface Culling" in props:
+        tristrip_header.backface_culling = props["Backface Culling"] > 0
+    if "Alpha Test Enable" in props:
+        tristrip_header.alpha_blend = props["Alpha Test Enable"] > 0
+    if  "Shade Flat" in props:
+        tristrip_header.shade_flat = props["Shade Flat"]
+    if "Texture Filter" in props:
+        tristrip_header.custom_tex_filter = True
+        tristrip_header.texture_filter = props["Texture Filter"]
+
+    # mesh creation
+    me = pmodel.Mesh()
+    me.tri_header = tristrip_header
+    me.vertex_format = pmodel.VertexFormat(
+        weight_count = tristrip_header.weightCount,
+        weight_f = pmodel.BYTE,
+        uv_f = pmodel.SHORT,
+        normal_f = pmodel.BYTE,
+        position_f = pmodel.SHORT
+    )
+
+    me.base_offset = 0
+
+    # In first use order the largest index is the submesh's vertex count, otherwise it's the object's
+    if reorder:
+        verts = list(dict.fromkeys(v for x in tri for v in x))
+        me.index_format = index_format(len(verts) - 1)
+    else:
+        verts = sorted(set(v for x in tri for v in x))
+        me.index_format = index_format(max(0, *[max(x) for x in tri]))
+    vert_remap = {v: k for k, v in enumerate(verts)}
+
+    me.indices = []
+
+    triangles = []
+    if use_lists:
+        tri, triangles = choose_primitives(tri, struct.calcsize(me.index_format))
+
+    for ind in tri:
+        index = pmodel.Index(me.index_format)
+        index.vertices = [vert_remap[v] for v in ind]
+        index.primative_type = 4  # tristrip mode
+        index.index_offset = 0
+        index.face_order = 0
+        me.indices.append(index)
+
+    # prim commands take at most 0xFFFF indices
+    for start in range(0, len(triangles), 0xFFFF):
+        index = pmodel.Index(me.index_format)
+        index.vertices = [vert_remap[v] for v in triangles[start:start+0xFFFF]]
+        index.primative_type = 3  # triangle list mode
+        index.index_offset = 0
+        index.face_order = 0
+        me.indices.append(index)
+
+    me.vertices = []
+
+    groups = [index for id, index in bones]
+    positions = arrays.positions[verts].tolist()
+    uvs = arrays.uvs[verts].tolist()
+    normals = arrays.normals[verts].tolist()
+    weights = arrays.weights[np.ix_(verts, groups)].tolist()
+    for co, uv, normal, w in zip(positions, uvs, normals, weights):
+        vertex = pmodel.Vertex()
+        vertex.bypass_transform = tristrip_header.bypass_transform
+        if tristrip_header.bypass_transform:
+            vertex.nortrans = 0x1
+            vertex.postrans = 0x1
+            vertex.textrans = 0x1
+            vertex.weitrans = 0x1
+        else:
+            vertex.nortrans = 0x7f
+            vertex.postrans = 0x7fff
+            vertex.textrans = 0x8000
+            vertex.weitrans = 0x80
+        vertex.verfor = me.vertex_format.struct
+
+        vertex.coords(*co)
+        vertex.vt(uv[0], 1 - uv[1])
+        vertex.scale = scale
+        vertex.vn(*normal)
+        vertex.w = w
+
+        me.vertices.append(vertex)
+
+    return me
+
+
+def fit_mesh(arrays: MeshArrays, props: dict, bones: tuple, tri: list[list[int]], scale: dict[str, float],
+             use_lists: bool = False) -> list[pmodel.Mesh]:
+    """Build a submesh in first use vertex order, split into pieces with 8 bit indices when that's smaller overall."""
+    whole = build_mesh(arrays, props, bones, tri, scale, use_lists, reorder=True)
+    if whole.index_format == "B":
+        return [whole]
+
+    pieces = split_strips(tri)
+    if len(pieces) == 1:
+        return [whole]
+    meshes = [build_mesh(arrays, props, bones, piece, scale, use_lists, reorder=True) for piece in pieces]
+    if sum(mesh_cost(mesh) for mesh in meshes) < mesh_cost(whole):
+        return meshes
+    return [whole]
+
+
+def weight_stats(tris: dict[tuple, list[list[int]]]) -> tuple[int, int, int]:
+    """Submesh count, weights stored over all submesh vertices and the vertex count."""
+    weights = vertices = 0
+    for bones, tristrips in tris.items():
+        count = len(set(v for strip in tristrips for v in strip))
+        weights += count * len(bones)
+        vertices += count
+    return len(tris), weights, vertices
+
+
+def build_mesh_header(arrays: MeshArrays, pmo_ver: bytes,
+                      options: BuildOptions = BuildOptions()) -> pmodel.MeshHeader | pmodel.FUMeshHeader:
+    """Stripify, partition by bones and build the submeshes of one object."""
+    mesh_header = pmodel.MeshHeader() if pmo_ver == pmodel.P3RD_MODEL else pmodel.FUMeshHeader()
+    mesh_header.materialCount = arrays.material_count
+    mesh_header.tristripCount = len(arrays.bone_ids)
+
+    if arrays.alpha_blending_params is not None:
+        mesh_header.alpha_blending_params = arrays.alpha_blending_params
+
+    if arrays.ld_at_factor_c is not None:
+        mesh_header.ld_at_factor_c = arrays.ld_at_factor_c
+
+    # Scale definition
+    abs_max = float(np.abs(arrays.positions).max()) if arrays.vertex_count else 0.0
+    scale = {"x": abs_max, "y": abs_max, "z": abs_max}
+    if pmo_ver == pmodel.P3RD_MODEL:
+        mesh_header.scale = scale
+
+    prune = options.weight_threshold > 0 or options.max_influences > 0
+    unpruned = arrays
+    if prune:
+        arrays = copy.copy(arrays)
+        arrays.prune_weights(options.weight_threshold, options.max_influences)
+    stats = np.zeros((2, 3), dtype=np.int64)
+
+    ready = []
+    for props, face_collection in group_faces(arrays).items():
+        strips = stripify(face_collection)
+        tris = partition_strips(arrays, strips)
+        if prune:
+            stats += [weight_stats(partition_strips(unpruned, strips)), weight_stats(tris)]
+
+        # Join all tristrips
+        if options.hard_tristripification:
+            tris = {bones: join_strips(tristrips) for bones, tristrips in tris.items()}
+
+        ready.append(({k: v for k, v in zip(["material"] + arrays.labels, props)}, tris))
+
+    if prune:
+        for name, counts in zip(("pruned_submeshes", "weights", "weighted_vertices"), stats.T.tolist()):
+            mesh_header.build_stats[name] = tuple(counts)
+
+    meshes = []
+    legacy_index_bytes = 0
+    for props, tris in ready:
+        for bones, tri in tris.items():  # tri header/submesh creation
+            with span("submesh build"):
+                if options.fit_indices:
+                    fitted = fit_mesh(arrays, props, bones, tri, scale, options.use_lists)
+                    # same primitives with indices as wide as the object's vertex count needs
+                    legacy_size = struct.calcsize(index_format(max(0, *[max(x) for x in tri])))
+                    legacy_index_bytes += sum(len(index.vertices) * legacy_size for mesh in fitted for index in mesh.indices)
+                    meshes.extend(fitted)
+                else:
+                    meshes.append(build_mesh(arrays, props, bones, tri, scale, options.use_lists))
+
+    if options.fit_indices:
+        mesh_header.build_stats["index_bytes"] = (legacy_index_bytes, index_bytes(meshes))
+
+    mesh_header.meshes = meshes
+    return mesh_header
+
+
+def state_key(mesh: pmodel.Mesh) -> tuple:
+    tri = mesh.tri_header
+    return (tri.materialOffset, tri.alpha_blend, tri.backface_culling, tri.texture_filter if tri.custom_tex_filter else None, tri.shade_flat)
+
+
+def count_switches(meshes: list[pmodel.Mesh]) -> int:
+    """Material and GE state changes between consecutive submeshes."""
+    keys = [state_key(mesh) for mesh in meshes]
+    return sum(a != b for prev, key in zip(keys, keys[1:]) for a, b in zip(prev, key))
+
+
+def sort_meshes(mesh_header: pmodel.MeshHeader | pmodel.FUMeshHeader) -> None:
+    """Order submeshes by material, then render state, then bone palette, so equal state ends up adjacent."""
+    mesh_header.meshes.sort(key=lambda mesh: (*state_key(mesh), mesh.tri_header.bones))
+
+
+def can_merge_headers(target: pmodel.MeshHeader | pmodel.FUMeshHeader, header: pmodel.MeshHeader | pmodel.FUMeshHeader,
+                      pmo_ver: bytes) -> bool:
+    if getattr(target, "alpha_blending_params", None) != getattr(header, "alpha_blending_params", None):
+        return False
+    if target.ld_at_factor_c != header.ld_at_factor_c:
+        return False
+    if pmo_ver == pmodel.FU_MODEL:
+        # FU tristrips index their material relative to the header's lowest one, so materials have to stay contiguous
+        materials = set(target.mat_remaps) | set(header.mat_remaps)
+        return max(materials) - min(materials) + 1 == len(materials)
+    return True
+
+
+def merge_mesh(target: pmodel.Mesh, mesh: pmodel.Mesh) -> None:
+    """Append mesh's primitives and vertices to target, with its weights moved into target's bone palette."""
+    # headers can come from the mesh cache, the palette and vertex format are replaced rather than extended
+    bones = target.tri_header.bones + [bone for bone in mesh.tri_header.bones if bone not in target.tri_header.bones]
+    target.tri_header.bones = bones
+    target.vertex_format = copy.copy(target.vertex_format)
+
+    vert: pmodel.Vertex
+    for vert in target.vertices:
+        vert.w = vert.w + [0.0] * (len(bones) - len(vert.w))
+    positions = [bones.index(bone) for bone in mesh.tri_header.bones]
+    for vert in mesh.vertices:
+        weights = [0.0] * len(bones)
+        for position, weight in zip(positions, vert.w):
+            weights[position] = weight
+        vert.w = weights
+
+    offset = len(target.vertices)
+    for index in mesh.indices:
+        index.vertices = [v + offset for v in index.vertices]
+    target.vertices.extend(mesh.vertices)
+    target.indices.extend(mesh.indices)
+
+    widths = "BHI"
+    target.index_format = widths[max(widths.index(target.index_format), widths.index(mesh.index_format),
+                                     widths.index(index_format(len(target.vertices) - 1)))]
+    for index in target.indices:
+        index.format = target.index_format
+
+    target.tri_header.weightCount = len(bones)
+    target.vertex_format.weight_count = len(bones)
+    for vert in target.vertices:
+        vert.verfor = target.vertex_format.struct
+
+
+def merge_saves(target: pmodel.Mesh, mesh: pmodel.Mesh) -> bool:
+    """Whether merging mesh into target keeps the bytes from growing, it always saves a draw call.
+
+    Merged palettes widen every vertex's weights, so this is tried on copies.
+    """
+    if len(set(target.tri_header.bones) | set(mesh.tri_header.bones)) > 8:
+        return False
+    merged = copy.deepcopy(target)
+    merge_mesh(merged, copy.deepcopy(mesh))
+    return mesh_cost(merged) <= mesh_cost(target) + mesh_cost(mesh)
+
+
+def merge_submeshes(mesh_headers: list, pmo_ver: bytes) -> list:
+    """Put objects with the same header parameters into one mesh header, and merge their submeshes that share
+    material and render state as long as the combined bone palette fits the GE's 8 weights and the file doesn't grow."""
+    merged = []
+    for header in mesh_headers:
+        target = next((target for target in merged if can_merge_headers(target, header, pmo_ver)), None)
+        if target is None:
+            target = header
+            merged.append(header)
+            meshes, header.meshes = header.meshes, []
+        else:
+            meshes = header.meshes
+
+        for mesh in meshes:
+            key = (*state_key(mesh), mesh.tri_header.bypass_transform)
+            into = next((other for other in target.meshes if (*state_key(other), other.tri_header.bypass_transform) == key
+                         and merge_saves(other, mesh)), None)
+            if into is None:
+                target.meshes.append(mesh)
+            else:
+                merge_mesh(into, mesh)
+
+    return merged
+
+
+def intern_materials(pmo: pmodel.PMO, mesh_headers: list) -> None:
+    """Point submeshes at the first of byte identical materials and drop the other copies."""
+    materials, remap, seen = [], {}, {}
+    for index, mat in enumerate(pmo.materials):
+        data = mat.tobytes()
+        if data not in seen:
+            seen[data] = len(materials)
+            materials.append(mat)
+        remap[index] = seen[data]
+
+    for mesh_header in mesh_headers:
+        for mesh in mesh_header.meshes:
+            mesh.tri_header.materialOffset = remap.get(mesh.tri_header.materialOffset, mesh.tri_header.materialOffset)
+    pmo.build_stats["materials"] = (len(pmo.materials), len(materials))
+    pmo.materials = materials
+
+
+def build_pmo(pmo_ver: bytes, mesh_headers: list, pmo_mats: list[tuple[int, pmodel.Material]],
+              options: BuildOptions = BuildOptions()) -> pmodel.PMO:
+    """Put the mesh headers of every object and the materials together, in the given order."""
+    pmo = pmodel.PMO()
+    pmo.header.ver = pmo_ver
+    pmo.use_mat_remap = options.use_mat_remaps
+    pmo.elide_states = options.elide_states
+    pmo.vertex_tolerances = options.vertex_tolerances
+    pmo.local_scales = options.local_scales
+    pmo.share_vertex_data = options.share_vertices
+
+    # Adding materials
+    for _, mat in sorted(pmo_mats, key=lambda x: x[0]):
+        pmo.materials.append(mat)
+
+    for mesh_header in mesh_headers:
+        for name, (before, after) in mesh_header.build_stats.items():
+            total = pmo.build_stats.get(name, (0, 0))
+            pmo.build_stats[name] = (total[0] + before, total[1] + after)
+
+    # FU tristrips index materials relative to their header's lowest one, which merged materials could break
+    if options.intern_tables and pmo_ver == pmodel.P3RD_MODEL:
+        intern_materials(pmo, mesh_headers)
+
+    if options.merge_objects:
+        before = sum(len(mesh_header.meshes) for mesh_header in mesh_headers)
+        mesh_headers = merge_submeshes(mesh_headers, pmo_ver)
+        pmo.build_stats["merged_submeshes"] = (before, sum(len(mesh_header.meshes) for mesh_header in mesh_headers))
+
+    if options.sort_submeshes:
+        before = sum(count_switches(mesh_header.meshes) for mesh_header in mesh_headers)
+        for mesh_header in mesh_headers:
+            sort_meshes(mesh_header)
+        pmo.build_stats["state_switches"] = (before, sum(count_switches(mesh_header.meshes) for mesh_header in mesh_headers))
+
+    # Bone data is written in submesh order, so this has to follow any reordering.
+    # Interned submeshes point at the first copy of an identical palette instead.
+    palettes: dict[tuple[int, ...], int] = {}
+    cumulativeWeightCount = 0
+    for mesh_header in mesh_headers:
+        for mesh in mesh_header.meshes:
+            palette = tuple(mesh.tri_header.bones)
+            if options.intern_tables and palette in palettes:
+                mesh.tri_header.cumulativeWeightCount = palettes[palette]
+                continue
+            palettes[palette] = cumulativeWeightCount
+            mesh.tri_header.cumulativeWeightCount = cumulativeWeightCount
+            cumulativeWeightCount += mesh.tri_header.weightCount
+
+        pmo.mesh_header.append(mesh_header)
+
+    if options.intern_tables:
+        pmo.build_stats["bone_palettes"] = (len(pmo.tristrips), len(palettes))
+
+    if options.elide_states:
+        before = sum(len(mesh.prims) for mesh in pmo.meshes)
+        pmo.link_states()
+        pmo.build_stats["display_list_commands"] = (before // 4, sum(len(mesh.prims) for mesh in pmo.meshes) // 4)
+
+    return pmo
@@ -0,0 +1,46 @@
+import pickle
+from collections import OrderedDict
+
+from . import model as pmodel
+
+
+class MeshCache:
+    """In-session cache of built mesh headers, keyed by mesh_arrays.source_hash.
+
+    Entries are kept pickled, so every hit hands out a fresh MeshHeader that PMO.update can move and
+    rescale freely. The least recently used entries are evicted once max_bytes is exceeded.
+    """
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.max_bytes: int = max_bytes
+        self.entries: OrderedDict[str, tuple[bytes, list[str]]] = OrderedDict()
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def get(self, key: str) -> tuple[pmodel.MeshHeader | pmodel.FUMeshHeader, list[str]] | None:
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        data, warnings = self.entries[key]
+        return pickle.loads(data), list(warnings)
+
+    def put(self, key: str, mesh_header: pmodel.MeshHeader | pmodel.FUMeshHeader, warnings: list[str] | None = None) -> None:
+        data = pickle.dumps(mesh_header, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key)[0])
+        self.entries[key] = (data, list(warnings or []))
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, (old, _) = self.entries.popitem(last=False)
+            self.size -= len(old)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
@@ -1,6 +1,8 @@
 import struct
 from math import ceil
 
+from .profiling import span
+
 FU_MODEL = b'1.0\x00'
 P3RD_MODEL = b'102\x00'
 
@@ -85,6 +87,9 @@ class MeshHeader(PMODATA):
         self.cumulativeTristripCount: int = 0
 
         self.meshes: list[Mesh] = []
+        self.vertex_blocks: list[VertexBlock] = []
+        # (before, after) counts of the build passes that ran on this object
+        self.build_stats: dict[str, tuple[int, int]] = {}
         # self.materials: list[int] = []
 
     def update(self) -> None:
@@ -133,6 +138,9 @@ class FUMeshHeader(PMODATA):
         self.alpha_blending_params: None
 
         self.meshes: list[Mesh] = []
+        self.vertex_blocks: list[VertexBlock] = []
+        # (before, after) counts of the build passes that ran on this object
+        self.build_stats: dict[str, tuple[int, int]] = {}
         # self.materials: list[Material] = []
 
     def set_scale(self, scale) -> None:
@@ -234,6 +242,7 @@ class Vertex(PMODATA):
         self.color_trans: int | None = None
         self.scale: dict[str, float] = {"x": 0.0, "y": 0.0, "z": 0.0}
         self.uv_scale: dict[str, float] = {'u': 1.0, 'v': 1.0}
+        self.bypass_transform: bool = False  # raw coordinates, not divided by the scales
         self.verfor: str = "1B2H3b3h"  # vertex format
         self.size: int = self.calcsize()
 
@@ -269,27 +278,32 @@ class Vertex(PMODATA):
         self.y = float(y)
         self.z = float(z)
 
+    @staticmethod
+    def quantize(value: float, trans: int | float) -> int | float:
+        # float trans values are for float components, which aren't rounded
+        return value * trans if isinstance(trans, float) else round(value * trans)
+
     def to_pmo(self) -> bytes:
         data = []
         if self.weitrans is not None:
-            data.extend([round(float(w)*self.weitrans) for w in self.w])
+            data.extend([self.quantize(float(w), self.weitrans) for w in self.w])
         if self.textrans is not None:
-            if self.textrans == 1:
+            if self.bypass_transform:
                 self.uv_scale = {'u': 1.0, 'v': 1.0}
-            data.append(max(0, round((float(self.u) / self.uv_scale['u']) * self.textrans)))
-            data.append(max(0, round((float(self.v) / self.uv_scale['v']) * self.textrans)))
+            data.append(max(0, self.quantize(float(self.u) / self.uv_scale['u'], self.textrans)))
+            data.append(max(0, self.quantize(float(self.v) / self.uv_scale['v'], self.textrans)))
         if self.color_trans is not None:
             data.append(self.color)  # color_trans
         if self.nortrans is not None:
-            data.append(round(float(self.i) * self.nortrans))
-            data.append(round(float(self.j) * self.nortrans))
-            data.append(round(float(self.k) * self.nortrans))
+            data.append(self.quantize(float(self.i), self.nortrans))
+            data.append(self.quantize(float(self.j), self.nortrans))
+            data.append(self.quantize(float(self.k), self.nortrans))
         if self.postrans is not None:
-            if self.postrans == 1:
+            if self.bypass_transform:
                 self.scale = {'x': 1.0, 'y': 1.0, 'z': 1.0}
-            data.append(round((float(self.x) / self.scale["x"]) * self.postrans))
-            data.append(round((float(self.y) / self.scale["y"]) * self.postrans))
-            data.append(round((float(self.z) / self.scale["z"]) * self.postrans))
+            data.append(self.quantize(float(self.x) / self.scale["x"], self.postrans))
+            data.append(self.quantize(float(self.y) / self.scale["y"], self.postrans))
+            data.append(self.quantize(float(self.z) / self.scale["z"], self.postrans))
         return struct.pack(self.verfor, *data)
 
     def write(self, file) -> None:
@@ -329,6 +343,9 @@ class Index(PMODATA):
 
         return byted
 
+    def calcsize(self) -> int:
+        return 0 if self.format is None else len(self.vertices) * struct.calcsize(self.format)
+
     def to_faces(self) -> list:
         faces = []
 
@@ -338,7 +355,8 @@ class Index(PMODATA):
 
         for vert in r:
             face = {3: self.vertices[vert + 2] + self.index_offset}
-            if ((vert + self.face_order) % 2) or ((self.primative_type == 3) and self.face_order):
+            # only strips alternate winding, list triangles all follow face_order
+            if ((self.primative_type != 3) and (vert + self.face_order) % 2) or ((self.primative_type == 3) and self.face_order):
                 face[2] = self.vertices[vert] + self.index_offset
                 face[1] = self.vertices[vert + 1] + self.index_offset
             else:
@@ -352,6 +370,10 @@ BYTE = 1
 SHORT = 2
 FLOAT = 3
 
+# vertex trans values, what 1.0 is stored as for each component format
+SIGNED_TRANS = {BYTE: 0x7f, SHORT: 0x7fff, FLOAT: 1.0}
+UV_TRANS = {BYTE: 0x80, SHORT: 0x8000, FLOAT: 1.0}
+
 class VertexFormat:
     def __init__(self, weight_f: int | None = BYTE, uv_f: int | None = SHORT, color_f: int | None = None, normal_f: int | None = BYTE, 
                  position_f: int | None = SHORT, weight_count: int = 0, bypass_transform: int = 0) -> None:
@@ -378,6 +400,11 @@ class VertexFormat:
             str_format += ["", "2bB", "2hH", "3f"][self.position_f]
         else:
             str_format += ["", "3b", "3h", "3f"][self.position_f]
+
+        # vertices are aligned to their largest component
+        color_f = None if self.color_f is None else FLOAT if self.color_f == 7 else SHORT
+        largest = max(f for f in (self.weight_f, self.uv_f, color_f, self.normal_f, self.position_f) if f is not None)
+        str_format += ["", "", "0h", "0f"][largest]
         
         return str_format
 
@@ -392,6 +419,12 @@ class Mesh(PMODATA):
         self.indices: None | list[Index] = None
         self.base_offset: None | int = None
         #self.bypass_transform: int = 0
+        # shared vertex data and where this submesh's vertices start in it, set by PMO.share_vertices
+        self.vertex_block: None | VertexBlock = None
+        self.block_start: int = 0
+        # neighbouring submeshes of the same mesh header, set by PMO.link_states
+        self.prev_mesh: None | Mesh = None
+        self.next_mesh: None | Mesh = None
 
         self.face_order: None | int = None
 
@@ -399,6 +432,38 @@ class Mesh(PMODATA):
     def bypass_transform(self) -> int:
         return 1 if self.tri_header.bypass_transform else 0
 
+    def fit_vertex_format(self, position_tolerance: float, uv_tolerance: float, normal_tolerance: float) -> None:
+        """Use the smallest position, UV and normal formats whose quantization error stays within the tolerances.
+
+        Errors are measured after scaling, so this has to run once PMO.fix_scales set the final scales.
+        """
+        if self.bypass_transform:
+            return
+
+        def error(values: list[float], trans: int | float) -> float:
+            return max((abs(Vertex.quantize(value, trans) / trans - value) for value in values), default=0.0)
+
+        def smallest(values: list[float], trans: dict, tolerance: float) -> int:
+            return next((f for f in (BYTE, SHORT) if error(values, trans[f]) <= tolerance), FLOAT)
+
+        # tolerances are in model and UV units, the stored values are relative to the scales
+        scale = self.vertices[0].scale["x"] or 1.0
+        uv_scale = max(self.vertices[0].uv_scale.values()) or 1.0
+        positions = [c / scale for vert in self.vertices for c in (vert.x, vert.y, vert.z)]
+        uvs = [vert.u / vert.uv_scale['u'] for vert in self.vertices] + [vert.v / vert.uv_scale['v'] for vert in self.vertices]
+        normals = [c for vert in self.vertices for c in (vert.i, vert.j, vert.k)]
+
+        self.vertex_format.position_f = smallest(positions, SIGNED_TRANS, position_tolerance / scale)
+        self.vertex_format.uv_f = smallest(uvs, UV_TRANS, uv_tolerance / uv_scale)
+        self.vertex_format.normal_f = smallest(normals, SIGNED_TRANS, normal_tolerance)
+
+        vert: Vertex
+        for vert in self.vertices:
+            vert.postrans = SIGNED_TRANS[self.vertex_format.position_f]
+            vert.textrans = UV_TRANS[self.vertex_format.uv_f]
+            vert.nortrans = SIGNED_TRANS[self.vertex_format.normal_f]
+            vert.verfor = self.vertex_format.struct
+
     @property
     def max_index(self) -> int:
         return max(0, *[max(index) for index in self.indices])
@@ -453,19 +518,27 @@ class Mesh(PMODATA):
 
     @property
     def prims(self) -> bytes:
+        # Alpha, culling and texture filter are set and reset by every display list, the game's material binds and
+        # face flag hiding between tristrips can leave them changed. Flat shading and face order left set by the
+        # previous submesh aren't set again, and flat shading isn't reset if the next one sets it anyway.
+        tri = self.tri_header
+        prev_tri = None if self.prev_mesh is None else self.prev_mesh.tri_header
+        next_tri = None if self.next_mesh is None else self.next_mesh.tri_header
+
         prims = b''
-        if self.tri_header.alpha_blend:
+        if tri.alpha_blend:
             prims += b'\x01\x00\x00\x21'  # enable alpha blending
             prims += b'\x07\x05\xFF\xdb'  # set alpha test parameters
         
-        if self.tri_header.shade_flat:
+        if tri.shade_flat and not (prev_tri is not None and prev_tri.shade_flat):
             prims += b'\x00\x00\x00\x50'
         
-        if self.tri_header.custom_tex_filter:
-            prims += struct.pack("2BxB", self.tri_header.texture_filter//10, self.tri_header.texture_filter%10, 0xC6)
+        if tri.custom_tex_filter:
+            prims += struct.pack("2BxB", tri.texture_filter//10, tri.texture_filter%10, 0xC6)
         
-        face_order = None
-        prims += struct.pack("I", (1 if self.tri_header.backface_culling else 0) | 0x1D000000)
+        prims += struct.pack("I", (1 if tri.backface_culling else 0) | 0x1D000000)
+
+        face_order = None if self.prev_mesh is None else self.prev_mesh.indices[-1].face_order
         index: Index
         for index in self.indices:
             if index.face_order != face_order:
@@ -478,36 +551,55 @@ class Mesh(PMODATA):
 
             prims += struct.pack("I", prim)
         
-        if self.tri_header.alpha_blend:
+        if tri.alpha_blend:
             prims += b'\x00\x00\x00\x21'  # disable alpha blending
         
-        if self.tri_header.shade_flat:
+        if tri.shade_flat and not (next_tri is not None and next_tri.shade_flat):
             prims += b'\x01\x00\x00\x50'
         
-        if self.tri_header.backface_culling:
+        if tri.backface_culling:
             prims += struct.pack("I", 0x1D000000)  # disable backface culling
 
-        if self.tri_header.custom_tex_filter:
+        if tri.custom_tex_filter:
             prims += struct.pack("2BxB", 7, 1, 0xC6)  # default tex filter
         
         return prims
 
+    @property
+    def data_start(self) -> int:
+        start = 0x1C + len(self.prims)
+        if start % 8:
+            start += start % 8
+        return start
+
     @property
     def vaddr(self) -> int:
-        vaddr = 0x1C + len(self.prims)
-        if vaddr % 8:
-            vaddr += vaddr % 8
-        return vaddr
+        if self.vertex_block is None:
+            return self.data_start
+        if self.vertex_block.address is None or self.address is None:
+            return 0  # not laid out yet, doesn't change the size
+        return self.vertex_block.address + self.block_start * self.vertex_block.stride - self.address
 
     @property
     def iaddr(self) -> int:
         if self.index_format is None:
             return 0
+        if self.vertex_block is not None:
+            return self.data_start
         iaddr = self.vaddr + len(self.vertices) * struct.calcsize(self.vertex_format.struct)
         if iaddr % 8:
             iaddr += iaddr % 8
         return iaddr
 
+    @property
+    def data_size(self) -> int:
+        """Length of to_pmo(newfile=True), without encoding vertices or indices."""
+        size = 4 * (6 + (self.index_format is not None)) + len(self.prims)
+        if self.vertex_block is None:
+            size = max(size, self.vaddr) + sum(vert.calcsize() for vert in self.vertices)
+        size = max(size, self.iaddr) + sum(index.calcsize() for index in self.indices)
+        return size + size % 4
+
     def to_pmo(self, newfile=False) -> bytes:
         start = (b'\x00\x00\x00\x14'  # set origin
                  b'\x00\x00\x00\x10')  # set base_address
@@ -528,7 +620,12 @@ class Mesh(PMODATA):
         byted = start + addresses + vtype + self.prims + (b'\x00\x00\x00\x13'  # set offset
                                                           b'\x00\x00\x00\x0B')  # return
 
-        if newfile:
+        if newfile and self.vertex_block is not None:
+            if len(byted) < iaddr:
+                byted += bytes(iaddr - len(byted))
+            byted += self.index_data
+            byted += bytes(len(byted) % 4)
+        elif newfile:
             if len(byted) < vaddr:
                 byted += bytes(vaddr - len(byted))
             byted += self.vertex_data
@@ -540,12 +637,37 @@ class Mesh(PMODATA):
         return byted
 
 
+class VertexBlock(PMODATA):
+    """Deduplicated vertex data shared by submeshes of one mesh header with the same vertex format."""
+    def __init__(self, verfor: str) -> None:
+        super().__init__()
+        self.verfor: str = verfor
+        self.vertices: list[Vertex] = []
+
+    @property
+    def stride(self) -> int:
+        return struct.calcsize(self.verfor)
+
+    def calcsize(self) -> int:
+        return len(self.vertices) * self.stride
+
+    def tobytes(self) -> bytes:
+        return b''.join(vert.to_pmo() for vert in self.vertices)
+
+
 class PMO:
     def __init__(self) -> None:
         self.header = PMOHeader()
         self.materials: list[Material] = []
         self.mesh_header: list[MeshHeader | FUMeshHeader] = []
         self.use_mat_remap: bool = False
+        self.elide_states: bool = False
+        # (position, uv, normal) quantization tolerances, None keeps the formats the meshes were built with
+        self.vertex_tolerances: tuple[float, float, float] | None = None
+        self.local_scales: bool = False
+        self.share_vertex_data: bool = False
+        # (before, after) counts of the build passes, summed over objects, for the report
+        self.build_stats: dict[str, tuple[int, int]] = {}
 
     def __repr__(self) -> str:
         string = (f'\nMeshes: {len(self.mesh_header)}\n'
@@ -607,20 +729,24 @@ class PMO:
             vertices.extend(mesh.vertices)
         return vertices
 
-    def fix_scales(self) -> None:
-        min_u = min(0, min([vert.u for vert in self.vertices]))
-        min_v = min(0, min([vert.v for vert in self.vertices]))
+    @staticmethod
+    def position_bound(vertices: list[Vertex]) -> float:
+        return max(max(abs(vert.x), abs(vert.y), abs(vert.z)) for vert in vertices)
+
+    @staticmethod
+    def uv_bounds(vertices: list[Vertex]) -> tuple[float, float, int, int]:
+        """UV scale and the whole number offset that moves negative UVs into the positive range, which doesn't change wrapped textures."""
+        min_u = min(0, min([vert.u for vert in vertices]))
+        min_v = min(0, min([vert.v for vert in vertices]))
         u_offset = ceil(abs(min_u)) if min_u < 0 else 0
         v_offset = ceil(abs(min_v)) if min_v < 0 else 0
-        max_u = u_offset + max([vert.u for vert in self.vertices])
-        max_v = v_offset + max([vert.v for vert in self.vertices])
-        max_x = max(max([vert.x for vert in self.vertices]),
-                   -1*min([vert.x for vert in self.vertices]), self.header.scale["x"])
-        max_y = max(max([vert.y for vert in self.vertices]),
-                   -1 * min([vert.y for vert in self.vertices]), self.header.scale["y"])
-        max_z = max(max([vert.z for vert in self.vertices]),
-                   -1 * min([vert.z for vert in self.vertices]), self.header.scale["z"])
-        abs_max = max(max_x, max_y, max_z)
+        max_u = u_offset + max([vert.u for vert in vertices])
+        max_v = v_offset + max([vert.v for vert in vertices])
+        return max_u or 1.0, max_v or 1.0, u_offset, v_offset
+
+    def fix_scales(self) -> None:
+        uv_bounds = self.uv_bounds(self.vertices)
+        abs_max = max(self.position_bound(self.vertices), *self.header.scale.values())
         self.header.clippingDistance = abs_max
         new_scale = {
             "x": abs_max,
@@ -631,19 +757,85 @@ class PMO:
             self.header.scale = new_scale
         mesh: MeshHeader | FUMeshHeader
         for mesh in self.mesh_header:
-            mesh.set_scale(new_scale)
+            vertices = [vert for submesh in mesh.meshes for vert in submesh.vertices]
+            scale, (max_u, max_v, u_offset, v_offset) = new_scale, uv_bounds
+            # P3rd mesh headers carry their own scales, FU ones only get the model's
+            if self.local_scales and self.ver == P3RD_MODEL:
+                local_max = self.position_bound(vertices) or abs_max
+                scale = {"x": local_max, "y": local_max, "z": local_max}
+                max_u, max_v, u_offset, v_offset = self.uv_bounds(vertices)
+            mesh.set_scale(scale)
             mesh.set_uv_scale(max_u, max_v)
-        vert: Vertex
-        for vert in self.vertices:
-            vert.set_scale(new_scale)
-            vert.set_uv_scale(max_u, max_v)
-            vert.offset_uvs(u_offset, v_offset)
+            vert: Vertex
+            for vert in vertices:
+                vert.set_scale(scale)
+                vert.set_uv_scale(max_u, max_v)
+                vert.offset_uvs(u_offset, v_offset)
+
+    def share_vertices(self) -> None:
+        """Move the vertices of each mesh header's submeshes into one deduplicated block per vertex format.
+
+        Submeshes point their vertex address at their first vertex in the block, so indices stay small.
+        A submesh only moves in when that's smaller than keeping its own vertices, reusing one early vertex
+        stretches its range over the block and can widen its indices.
+        Vertices are compared as written, so this has to run after scales and formats are final.
+        """
+        for mheader in self.mesh_header:
+            mheader.vertex_blocks = []
+            blocks: dict[str, VertexBlock] = {}
+            positions: dict[str, dict[bytes, int]] = {}
+            for mesh in mheader.meshes:
+                verfor = mesh.vertex_format.struct
+                block = blocks.get(verfor) or VertexBlock(verfor)
+                seen = positions.setdefault(verfor, {})
+
+                remap = []
+                added: dict[bytes, int] = {}
+                for vert in mesh.vertices:
+                    data = vert.to_pmo()
+                    if data not in seen and data not in added:
+                        added[data] = len(block.vertices) + len(added)
+                    remap.append(seen[data] if data in seen else added[data])
+
+                start, end = min(remap), max(remap)
+                index_format = "B" if end - start <= 255 else "H" if end - start <= 0xFFFF else "I"
+                shared_size = mesh.data_start + sum(len(index.vertices) for index in mesh.indices) * struct.calcsize(index_format)
+                if shared_size + shared_size % 4 + len(added) * block.stride > mesh.data_size:
+                    continue
+
+                if verfor not in blocks:
+                    blocks[verfor] = block
+                    mheader.vertex_blocks.append(block)
+                new_vertices = {index: vert for vert, index in zip(mesh.vertices, remap) if index >= len(block.vertices)}
+                block.vertices.extend(new_vertices[index] for index in sorted(new_vertices))
+                seen.update(added)
+
+                mesh.vertex_block = block
+                mesh.block_start = start
+                mesh.vertices = block.vertices[start:end+1]
+                mesh.index_format = index_format
+                for index in mesh.indices:
+                    index.format = mesh.index_format
+                    index.vertices = [remap[v] - start for v in index.vertices]
+
+    def link_states(self) -> None:
+        """Chain the submeshes of every mesh header, they're drawn in order so GE state carries over between them."""
+        for mheader in self.mesh_header:
+            for index, mesh in enumerate(mheader.meshes):
+                mesh.prev_mesh = mheader.meshes[index-1] if self.elide_states and index > 0 else None
+                mesh.next_mesh = mheader.meshes[index+1] if self.elide_states and index+1 < len(mheader.meshes) else None
 
     @property
     def bone_data(self) -> bytes:
+        # tristrips sharing a palette point at the same weight offset, it's only written once
         data = b''
+        written = set()
         tri: TristripHeader
         for tri in self.tristrips:
+            palette = (tri.cumulativeWeightCount, tuple(tri.bones))
+            if palette in written:
+                continue
+            written.add(palette)
             data += tri.bone_data
         if len(data) % 0x10:
             data += bytes(0x10 - len(data) % 0x10)
@@ -690,8 +882,19 @@ class PMO:
     def update(self) -> None:
         self.header.move(0)
 
-        self.fix_scales()
+        with span("fix_scales"):
+            self.fix_scales()
+        if self.vertex_tolerances is not None:
+            for mesh in self.meshes:
+                mesh.fit_vertex_format(*self.vertex_tolerances)
+        if self.share_vertex_data:
+            self.share_vertices()
+        self.link_states()
+
+        with span("layout"):
+            self._layout()
 
+    def _layout(self) -> None:
         self.header.meshCount = len(self.mesh_header)
         self.header.materialCount = len(self.materials)
 
@@ -733,20 +936,33 @@ class PMO:
         self.header.meshDataOffset = self.header.materialDataOffset + self.materials[0].size*len(self.materials)
         offset = 0
         mesh: Mesh
-        for mesh in self.meshes:
-            while (self.header.meshDataOffset + offset) % 8:
-                offset += 1
-            mesh.move(self.header.meshDataOffset + offset)
-            mesh.tri_header.vertexOffset = mesh.vaddr + offset
-            mesh.tri_header.meshOffset = offset
-            mesh.tri_header.indexOffset = mesh.iaddr + offset
-            offset += len(mesh.to_pmo(newfile=True))
+        for mheader in self.mesh_header:
+            for mesh in mheader.meshes:
+                while (self.header.meshDataOffset + offset) % 8:
+                    offset += 1
+                mesh.move(self.header.meshDataOffset + offset)
+                mesh.tri_header.meshOffset = offset
+                offset += mesh.data_size
+            # shared vertex blocks go after the display lists using them
+            block: VertexBlock
+            for block in mheader.vertex_blocks:
+                while (self.header.meshDataOffset + offset) % 8:
+                    offset += 1
+                block.move(self.header.meshDataOffset + offset)
+                offset += block.calcsize()
+            for mesh in mheader.meshes:
+                mesh.tri_header.vertexOffset = mesh.vaddr + mesh.tri_header.meshOffset
+                mesh.tri_header.indexOffset = mesh.iaddr + mesh.tri_header.meshOffset
 
         self.header.filesize = self.header.meshDataOffset + offset
 
     def save(self, fd, second=None) -> None:
         self.update()
 
+        with span("encode"):
+            self._write(fd, second)
+
+    def _write(self, fd, second=None) -> None:
         self.header.write(fd)
         # Write bone data
         fd.seek(self.header.boneDataOffset)
@@ -761,15 +977,21 @@ class PMO:
         for mat in self.materials:
             mat.write(fd)
         # Write mesh data
+        blocks = [block for mheader in self.mesh_header for block in mheader.vertex_blocks]
         if second is not None:
             for mesh in self.meshes:
                 second.seek(mesh.address-self.header.meshDataOffset)
                 second.write(mesh.to_pmo(newfile=True))
+            for block in blocks:
+                second.seek(block.address-self.header.meshDataOffset)
+                second.write(block.tobytes())
         else:
             mesh: Mesh
             for mesh in self.meshes:
                 fd.seek(mesh.address)
                 fd.write(mesh.to_pmo(newfile=True))
+            for block in blocks:
+                block.write(fd)
 
         # Write fu mat remap data
         if self.ver == FU_MODEL or self.use_mat_remap:
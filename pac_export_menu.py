@@ -1,17 +1,23 @@
 import bpy
 from bpy_extras.io_utils import ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 from bpy.types import Operator, Panel
 
-from .export_pac import export
+from . import export_session
+from . import profiling
+from . import report
+from .export_job import BackgroundExport
+from .export_pac import export, export_steps
+from .mesh_build import BuildOptions
 
 
-class ExportPac(Operator, ExportHelper):
+class ExportPac(BackgroundExport, Operator, ExportHelper):
     """Export Monster Hunter PAC files."""
     bl_idname = "export_mh.pac"
     bl_label = "Export PAC"
 
     filename_ext = ".pac"
+    scene_free_stages = frozenset(("Encoding textures", "Writing"))  # skeleton and textures are read after the model
 
     filter_glob: StringProperty(
         default="*.pac",
@@ -49,6 +55,7 @@ class ExportPac(Operator, ExportHelper):
             ("simple", "Simple", "Just split seams and sharp edges"),
             ("*&", "*&'s", "Run *&'s script"),
             ("xenthos", "Xenthos'", "Run Xenthos' script"),
+            ("fast", "Fast", "Split vertices by UV and normal while reading the mesh, without modifying it"),
         ),
         default="simple"
     )
@@ -134,10 +141,144 @@ class ExportPac(Operator, ExportHelper):
         default=False
     )
 
+    use_cache: BoolProperty(
+        name="Reuse Unchanged Meshes",
+        description="Keep built meshes for the rest of the session and reuse them for objects that didn't change",
+        default=False
+    )
+
+    processes: IntProperty(
+        name="Worker Processes",
+        description="Build submeshes on this many processes. (1 builds everything in Blender's process)",
+        default=1,
+        min=1
+    )
+
+    elide_states: BoolProperty(
+        name="Elide GE State",
+        description="Don't set or reset flat shading and face order again between submeshes of the same object that share them",
+        default=False
+    )
+
+    sort_submeshes: BoolProperty(
+        name="Sort Submeshes",
+        description="Order each object's submeshes by material and render state to reduce state changes",
+        default=False
+    )
+
+    use_lists: BoolProperty(
+        name="Use Triangle Lists",
+        description="Draw short tristrips of a submesh as one triangle list when that's smaller",
+        default=False
+    )
+
+    fit_indices: BoolProperty(
+        name="Fit 8 Bit Indices",
+        description="Reorder each submesh's vertices by first use and split large submeshes when 8 bit indices make them smaller",
+        default=False
+    )
+
+    adaptive_formats: BoolProperty(
+        name="Adaptive Vertex Formats",
+        description="Store positions, UVs and normals of each submesh in the smallest format within the tolerances below",
+        default=False
+    )
+
+    position_tolerance: FloatProperty(
+        name="Position Tolerance",
+        description="Largest position error allowed by adaptive vertex formats",
+        default=0.005,
+        min=0.0
+    )
+
+    uv_tolerance: FloatProperty(
+        name="UV Tolerance",
+        description="Largest UV error allowed by adaptive vertex formats",
+        default=1/2048,
+        min=0.0,
+        precision=5
+    )
+
+    normal_tolerance: FloatProperty(
+        name="Normal Tolerance",
+        description="Largest normal error allowed by adaptive vertex formats",
+        default=0.01,
+        min=0.0
+    )
+
+    local_scales: BoolProperty(
+        name="Per Object Scales",
+        description="Scale positions and UVs to each object's own bounds instead of the whole model's, for more precision on small parts (MHP3rd only)",
+        default=False
+    )
+
+    weight_threshold: FloatProperty(
+        name="Weight Threshold",
+        description="Drop bone influences below this weight before building submeshes, the rest is rescaled",
+        default=0.0,
+        min=0.0,
+        max=1.0
+    )
+
+    max_influences: IntProperty(
+        name="Max Influences",
+        description="Keep at most this many bone influences per vertex. (0 keeps all)",
+        default=0,
+        min=0,
+        max=8
+    )
+
+    merge_objects: BoolProperty(
+        name="Merge Objects",
+        description="Combine objects with the same settings into one, and their submeshes that share material and render state",
+        default=False
+    )
+
+    share_vertices: BoolProperty(
+        name="Share Vertex Data",
+        description="Store the vertices of each object's submeshes once per vertex format, so vertices on submesh borders aren't duplicated",
+        default=False
+    )
+
+    intern_tables: BoolProperty(
+        name="Share Bone Palettes and Materials",
+        description="Write identical bone palettes once and merge materials with identical values (materials on MHP3rd only)",
+        default=False
+    )
+
+    write_report: BoolProperty(
+        name="Budget Report",
+        description="Write sizes, draw costs and texture VRAM next to the exported file as JSON and show them in the PMO tab",
+        default=False
+    )
+
+    dry_run: BoolProperty(
+        name="Dry Run",
+        description="Only build and lay out the model and report its predicted size, draws and texture VRAM, without writing any file",
+        default=False
+    )
+
+    profile_export: BoolProperty(
+        name="Profile Export",
+        description="Time every export stage and write the timings as JSON and as a Chrome trace next to the exported file",
+        default=False
+    )
+
+    background: BoolProperty(
+        name="Export in Background",
+        description="Keep Blender responsive while exporting, with progress on the cursor and the status bar. Esc cancels the export",
+        default=False
+    )
+
+    live_session: BoolProperty(
+        name="Start Live Session",
+        description="Keep track of changes after this export and export again to the same file on every save, rebuilding only changed objects and textures",
+        default=False
+    )
+
     def execute(self, context):
         face = (self.upper_face, self.ears, self.nape, self.lower_face, self.nose, self.eyes, self.makeup1, self.makeup2)
-        return export(
-            context,
+        kwargs = dict(
             filepath=self.filepath,
             version=self.type,
             target=self.export_target,
@@ -148,9 +289,42 @@ class ExportPac(Operator, ExportHelper):
             hairflags=self.hairflags,
             phys_id=self.phys_id,
             app_modifiers=self.apply_modifiers,
-            hard_tristripification=self.hard_tristripification,
-            do_fix_vg=self.do_fix_vg
+            do_fix_vg=self.do_fix_vg,
+            processes=self.processes,
+            use_cache=self.use_cache,
+            options=BuildOptions(
+                hard_tristripification=self.hard_tristripification,
+                use_lists=self.use_lists,
+                fit_indices=self.fit_indices,
+                weight_threshold=self.weight_threshold,
+                max_influences=self.max_influences,
+                elide_states=self.elide_states,
+                sort_submeshes=self.sort_submeshes,
+                vertex_tolerances=(self.position_tolerance, self.uv_tolerance, self.normal_tolerance) if self.adaptive_formats else None,
+                local_scales=self.local_scales,
+                merge_objects=self.merge_objects,
+                share_vertices=self.share_vertices,
+                intern_tables=self.intern_tables
+            ),
+            write_report=self.write_report
         )
+        # dry runs are quick, and sessions and profiles cover a whole export in one call
+        if self.background and not (self.dry_run or self.live_session or self.profile_export or bpy.app.background):
+            return self.start_background(context, export_steps, **kwargs)
+        with profiling.profiled(self.filepath if self.profile_export else None):
+            if self.dry_run:
+                estimate = export(context, dry_run=True, **kwargs)
+                if isinstance(estimate, set):
+                    return estimate
+                self.report({'INFO'}, f'Dry run: {report.format_estimate(estimate)}')
+                return {'FINISHED'}
+            if self.live_session:
+                error = export_session.unsupported(**kwargs)
+                if error is not None:
+                    self.report({'ERROR'}, error)
+                    return {'CANCELLED'}
+                return export_session.start(export, **kwargs).export()
+            return export(context, **kwargs)
     
     def draw(self, context):
         layout = self.layout
@@ -161,9 +335,32 @@ class ExportPac(Operator, ExportHelper):
         layout.prop(self, 'export_target')
         layout.prop(self, 'prep_pmo')
         layout.prop(self, 'cleanup_vg')
+        layout.prop(self, 'weight_threshold')
+        layout.prop(self, 'max_influences')
         layout.prop(self, 'do_fix_vg')
         layout.prop(self, 'apply_modifiers')
         layout.prop(self, 'hard_tristripification')
+        layout.prop(self, 'processes')
+        layout.prop(self, 'use_cache')
+        layout.prop(self, 'elide_states')
+        layout.prop(self, 'merge_objects')
+        layout.prop(self, 'sort_submeshes')
+        layout.prop(self, 'share_vertices')
+        layout.prop(self, 'intern_tables')
+        layout.prop(self, 'use_lists')
+        layout.prop(self, 'fit_indices')
+        layout.prop(self, 'local_scales')
+        layout.prop(self, 'adaptive_formats')
+        col = layout.column()
+        col.enabled = self.adaptive_formats
+        col.prop(self, 'position_tolerance')
+        col.prop(self, 'uv_tolerance')
+        col.prop(self, 'normal_tolerance')
+        layout.prop(self, 'write_report')
+        layout.prop(self, 'dry_run')
+        layout.prop(self, 'profile_export')
+        layout.prop(self, 'background')
+        layout.prop(self, 'live_session')
 
 
 class FaceFlags(Panel):
@@ -1,37 +1,65 @@
 import bpy
 from bpy_extras.io_utils import ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 from bpy.types import Operator
 
 from . import export_pmo
+from . import export_session
+from .export_job import BackgroundExport, atomic_write, run_steps, submit, waiting
+from .mesh_build import BuildOptions, apply_flat_options
+from . import profiling
+from . import report
 
 
 FU_MODEL = b'1.0\x00'
 P3RD_MODEL = b'102\x00'
 
-def export(context, filepath: str, version: str, target: str = 'scene', prepare_pmo: str = "none", cleanup_vg: bool = False, apply_modifiers: bool = False, 
-           hard_tristripification: bool = False, split: bool = False, do_fix_vg: bool = False, use_mat_remaps: bool = False):
-    ver = P3RD_MODEL if version == "1.2" else FU_MODEL
-    pmo, _ = export_pmo.export(ver, target=target, prepare_pmo=prepare_pmo, cleanup_vg=cleanup_vg, apply_modifiers=apply_modifiers, 
-                               hard_tristripification=hard_tristripification, do_fix_vg=do_fix_vg, use_mat_remaps=use_mat_remaps)
-    if isinstance(pmo, int):
-        return {'CANCELLED'}
+def write_pmo(pmo, filepath: str, split: bool = False, write_report: bool = False, cancelled=None) -> None:
     if split:
-        with open(filepath+"_header.pmo", 'wb') as f1, open(filepath+"_mesh.bin", 'wb') as f2:
+        with atomic_write(filepath+"_header.pmo", cancelled) as header_path, atomic_write(filepath+"_mesh.bin", cancelled) as mesh_path, \
+             open(header_path, 'wb') as f1, open(mesh_path, 'wb') as f2:
             pmo.save(f1, second=f2)
     else:
-        with open(filepath, 'wb') as f:
+        with atomic_write(filepath, cancelled) as path, open(path, 'wb') as f:
             pmo.save(f)
 
+    if write_report and not (cancelled is not None and cancelled.is_set()):
+        report.LAST_REPORT = report.pmo_report(pmo)
+        report.write_report(report.LAST_REPORT, filepath+".report.json")
+
+def export_steps(context, filepath: str, version: str, target: str = 'scene', prepare_pmo: str = "none", cleanup_vg: bool = False,
+                 apply_modifiers: bool = False, hard_tristripification: bool | None = None, split: bool = False, do_fix_vg: bool = False,
+                 use_mat_remaps: bool | None = None, processes: int = 1, use_cache: bool = False, options: BuildOptions = BuildOptions(),
+                 write_report: bool = False, dry_run: bool = False, session=None, worker=None, **flat_options):
+    # BuildOptions fields as keywords are deprecated, see export_pmo.export_steps
+    options = apply_flat_options(options, dict(flat_options, hard_tristripification=hard_tristripification,
+                                               use_mat_remaps=use_mat_remaps))
+    ver = P3RD_MODEL if version == "1.2" else FU_MODEL
+    pmo, _ = yield from export_pmo.export_steps(ver, target=target, prepare_pmo=prepare_pmo, cleanup_vg=cleanup_vg, apply_modifiers=apply_modifiers,
+                                                do_fix_vg=do_fix_vg, processes=processes, use_cache=use_cache, options=options,
+                                                session=session, worker=worker)
+    if isinstance(pmo, int):
+        return {'CANCELLED'}
+    if dry_run:  # lay the model out to know its size, but don't encode or write anything
+        pmo.update()
+        return report.pmo_estimate(pmo)
+    job = submit(worker, write_pmo, pmo, filepath, split, write_report, None if worker is None else worker.cancelled)
+    yield from waiting([job], "Writing", block=worker is None)
+    job.result()
     return {'FINISHED'}
-    
 
-class ExportPmo(Operator, ExportHelper):
+def export(*args, **kwargs):
+    """Run every export step at once, see export_steps."""
+    return run_steps(export_steps(*args, **kwargs))
+
+
+class ExportPmo(BackgroundExport, Operator, ExportHelper):
     """Export Monster Hunter PMO models."""
     bl_idname = "export_mh.pmo"
     bl_label = "Export PMO"
 
     filename_ext = ".pmo"
+    scene_free_stages = frozenset(("Building submeshes", "Building PMO", "Writing"))
 
     filter_glob: StringProperty(
         default="*.pmo",
@@ -69,6 +97,7 @@ class ExportPmo(Operator, ExportHelper):
             ("simple", "Simple", "Just split seams and sharp edges"),
             ("*&", "*&'s", "Run *&'s script"),
             ("xenthos", "Xenthos'", "Run Xenthos' script"),
+            ("fast", "Fast", "Split vertices by UV and normal while reading the mesh, without modifying it"),
         ),
         default="simple"
     )
@@ -109,20 +138,187 @@ class ExportPmo(Operator, ExportHelper):
         default=False
     )
 
+    use_cache: BoolProperty(
+        name="Reuse Unchanged Meshes",
+        description="Keep built meshes for the rest of the session and reuse them for objects that didn't change",
+        default=False
+    )
+
+    processes: IntProperty(
+        name="Worker Processes",
+        description="Build submeshes on this many processes. (1 builds everything in Blender's process)",
+        default=1,
+        min=1
+    )
+
+    elide_states: BoolProperty(
+        name="Elide GE State",
+        description="Don't set or reset flat shading and face order again between submeshes of the same object that share them",
+        default=False
+    )
+
+    sort_submeshes: BoolProperty(
+        name="Sort Submeshes",
+        description="Order each object's submeshes by material and render state to reduce state changes",
+        default=False
+    )
+
+    use_lists: BoolProperty(
+        name="Use Triangle Lists",
+        description="Draw short tristrips of a submesh as one triangle list when that's smaller",
+        default=False
+    )
+
+    fit_indices: BoolProperty(
+        name="Fit 8 Bit Indices",
+        description="Reorder each submesh's vertices by first use and split large submeshes when 8 bit indices make them smaller",
+        default=False
+    )
+
+    adaptive_formats: BoolProperty(
+        name="Adaptive Vertex Formats",
+        description="Store positions, UVs and normals of each submesh in the smallest format within the tolerances below",
+        default=False
+    )
+
+    position_tolerance: FloatProperty(
+        name="Position Tolerance",
+        description="Largest position error allowed by adaptive vertex formats",
+        default=0.005,
+        min=0.0
+    )
+
+    uv_tolerance: FloatProperty(
+        name="UV Tolerance",
+        description="Largest UV error allowed by adaptive vertex formats",
+        default=1/2048,
+        min=0.0,
+        precision=5
+    )
+
+    normal_tolerance: FloatProperty(
+        name="Normal Tolerance",
+        description="Largest normal error allowed by adaptive vertex formats",
+        default=0.01,
+        min=0.0
+    )
+
+    local_scales: BoolProperty(
+        name="Per Object Scales",
+        description="Scale positions and UVs to each object's own bounds instead of the whole model's, for more precision on small parts (MHP3rd only)",
+        default=False
+    )
+
+    weight_threshold: FloatProperty(
+        name="Weight Threshold",
+        description="Drop bone influences below this weight before building submeshes, the rest is rescaled",
+        default=0.0,
+        min=0.0,
+        max=1.0
+    )
+
+    max_influences: IntProperty(
+        name="Max Influences",
+        description="Keep at most this many bone influences per vertex. (0 keeps all)",
+        default=0,
+        min=0,
+        max=8
+    )
+
+    merge_objects: BoolProperty(
+        name="Merge Objects",
+        description="Combine objects with the same settings into one, and their submeshes that share material and render state",
+        default=False
+    )
+
+    share_vertices: BoolProperty(
+        name="Share Vertex Data",
+        description="Store the vertices of each object's submeshes once per vertex format, so vertices on submesh borders aren't duplicated",
+        default=False
+    )
+
+    intern_tables: BoolProperty(
+        name="Share Bone Palettes and Materials",
+        description="Write identical bone palettes once and merge materials with identical values (materials on MHP3rd only)",
+        default=False
+    )
+
+    write_report: BoolProperty(
+        name="Budget Report",
+        description="Write sizes, draw costs and texture VRAM next to the exported file as JSON and show them in the PMO tab",
+        default=False
+    )
+
+    dry_run: BoolProperty(
+        name="Dry Run",
+        description="Only build and lay out the model and report its predicted size, draws and texture VRAM, without writing any file",
+        default=False
+    )
+
+    profile_export: BoolProperty(
+        name="Profile Export",
+        description="Time every export stage and write the timings as JSON and as a Chrome trace next to the exported file",
+        default=False
+    )
+
+    background: BoolProperty(
+        name="Export in Background",
+        description="Keep Blender responsive while exporting, with progress on the cursor and the status bar. Esc cancels the export",
+        default=False
+    )
+
+    live_session: BoolProperty(
+        name="Start Live Session",
+        description="Keep track of changes after this export and export again to the same file on every save, rebuilding only changed objects",
+        default=False
+    )
+
     def execute(self, context):
-        return export(
-            context,
+        kwargs = dict(
             filepath=self.filepath,
             version=self.type,
             target=self.export_target,
             prepare_pmo=self.prep_pmo,
             cleanup_vg=self.cleanup_vg,
             apply_modifiers=self.apply_modifiers,
-            hard_tristripification=self.hard_tristripification,
             split=self.split,
             do_fix_vg=self.do_fix_vg,
-            use_mat_remaps=self.use_mat_remaps
+            processes=self.processes,
+            use_cache=self.use_cache,
+            options=BuildOptions(
+                hard_tristripification=self.hard_tristripification,
+                use_lists=self.use_lists,
+                fit_indices=self.fit_indices,
+                weight_threshold=self.weight_threshold,
+                max_influences=self.max_influences,
+                use_mat_remaps=self.use_mat_remaps,
+                elide_states=self.elide_states,
+                sort_submeshes=self.sort_submeshes,
+                vertex_tolerances=(self.position_tolerance, self.uv_tolerance, self.normal_tolerance) if self.adaptive_formats else None,
+                local_scales=self.local_scales,
+                merge_objects=self.merge_objects,
+                share_vertices=self.share_vertices,
+                intern_tables=self.intern_tables
+            ),
+            write_report=self.write_report
         )
+        # dry runs are quick, and sessions and profiles cover a whole export in one call
+        if self.background and not (self.dry_run or self.live_session or self.profile_export or bpy.app.background):
+            return self.start_background(context, export_steps, **kwargs)
+        with profiling.profiled(self.filepath if self.profile_export else None):
+            if self.dry_run:
+                estimate = export(context, dry_run=True, **kwargs)
+                if isinstance(estimate, set):
+                    return estimate
+                self.report({'INFO'}, f'Dry run: {report.format_estimate(estimate)}')
+                return {'FINISHED'}
+            if self.live_session:
+                error = export_session.unsupported(**kwargs)
+                if error is not None:
+                    self.report({'ERROR'}, error)
+                    return {'CANCELLED'}
+                return export_session.start(export, **kwargs).export()
+            return export(context, **kwargs)
 
 
 def menu_func_export(self, context):
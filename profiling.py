@@ -0,0 +1,152 @@
+"""
+Per-stage timing and memory instrumentation for exports, no bpy needed.
+
+Stages are wrapped in span("name") blocks. Until start() is called span hands out one shared no-op
+context manager, so instrumented code costs a global lookup per stage when profiling is off.
+
+    profiling.start()
+    ... export ...
+    profiler = profiling.stop()
+    profiler.write_json("model.profile.json")
+    profiler.write_chrome_trace("model.trace.json")  # chrome://tracing or ui.perfetto.dev
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class SpanStats:
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.total: float = 0.0  # seconds
+        self.max: float = 0.0
+        self.peak: int = 0  # bytes allocated on top of what was traced when the span started
+
+    def as_dict(self) -> dict:
+        return {"calls": self.calls, "total": self.total, "max": self.max, "peak": self.peak}
+
+
+class Span:
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.start: float = 0.0
+        self.memory: int = 0
+        self.peak: int = 0  # highest traced memory seen while this span was open
+
+    def __enter__(self) -> "Span":
+        if self.profiler.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak is reset for every span, open ones keep what they saw so far
+            for span in self.profiler.stack:
+                span.peak = max(span.peak, peak)
+            tracemalloc.reset_peak()
+            self.memory = self.peak = current
+        self.profiler.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        end = time.perf_counter()
+        profiler = self.profiler
+        profiler.stack.pop()
+
+        if profiler.trace_memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if profiler.stack:
+                profiler.stack[-1].peak = max(profiler.stack[-1].peak, self.peak)
+
+        stats = profiler.stats.setdefault(self.name, SpanStats())
+        stats.calls += 1
+        stats.total += end - self.start
+        stats.max = max(stats.max, end - self.start)
+        stats.peak = max(stats.peak, self.peak - self.memory)
+        profiler.events.append({
+            "name": self.name,
+            "ph": "X",
+            "ts": (self.start - profiler.origin) * 1e6,
+            "dur": (end - self.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"peak": self.peak - self.memory} if profiler.trace_memory else {},
+        })
+
+
+class Profiler:
+    def __init__(self, trace_memory: bool = True) -> None:
+        self.trace_memory: bool = trace_memory
+        self.stats: dict[str, SpanStats] = {}
+        self.events: list[dict] = []
+        self.stack: list[Span] = []
+        self.origin: float = time.perf_counter()
+        self.owns_tracing: bool = False  # tracemalloc was started for this profiler and is stopped with it
+
+    def span(self, name: str) -> Span:
+        return Span(self, name)
+
+    def as_dict(self) -> dict:
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    def summary(self) -> str:
+        lines = []
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].total):
+            line = f'{name}: {stats.total:.3f}s in {stats.calls} calls'
+            if self.trace_memory:
+                line += f', peak {stats.peak / 1024:.0f} KiB'
+            lines.append(line)
+        return "\n".join(lines)
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+
+PROFILER: Profiler | None = None
+NO_SPAN = nullcontext()
+
+
+def span(name: str) -> Span | nullcontext:
+    if PROFILER is None:
+        return NO_SPAN
+    return PROFILER.span(name)
+
+
+def start(trace_memory: bool = True) -> Profiler:
+    global PROFILER
+    stop()
+    PROFILER = Profiler(trace_memory)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        PROFILER.owns_tracing = True
+    return PROFILER
+
+
+def stop() -> Profiler | None:
+    global PROFILER
+    profiler, PROFILER = PROFILER, None
+    if profiler is not None and profiler.owns_tracing:
+        tracemalloc.stop()
+    return profiler
+
+
+@contextmanager
+def profiled(path: str | None, trace_memory: bool = True):
+    """Profile the block if path is given, writing path.profile.json and path.trace.json when it's done."""
+    if path is None:
+        yield None
+        return
+    profiler = start(trace_memory)
+    try:
+        yield profiler
+    finally:
+        stop()
+        profiler.write_json(path+".profile.json")
+        profiler.write_chrome_trace(path+".trace.json")
+        print(profiler.summary())
@@ -0,0 +1,224 @@
+"""
+Size and draw cost report of a laid out model and its textures, no bpy needed.
+
+    python -m pmo_export.report model.npz [--json] [--max-bytes N] [--max-commands N] [--max-vram N]
+
+Sizes are read from the layout PMO.update left behind, so the model has to be saved or updated first.
+"""
+import argparse
+import json
+import struct
+import sys
+from contextlib import redirect_stdout
+
+from . import intermediate
+from . import model as pmodel
+from .containers import TMH, GimImage, INDEX_FORMAT
+
+SECTIONS = ("header", "mesh_headers", "tristrip_headers", "material_remap", "bone_data", "materials",
+            "display_lists", "vertex", "index", "padding")
+
+CLUT_BITS = dict(INDEX_FORMAT)
+
+# Report of the last export done in Blender, shown by the PMO budget panel
+LAST_REPORT: dict | None = None
+
+
+def ge_command_count(mesh: pmodel.Mesh) -> int:
+    """Command words in a submesh's display list, origin, base, addresses, vtype, state, prims, offset and return."""
+    return 6 + (mesh.index_format is not None) + len(mesh.prims) // 4
+
+
+def submesh_report(mesh: pmodel.Mesh) -> dict:
+    stride = struct.calcsize(mesh.vertex_format.struct)
+    return {
+        "material": mesh.tri_header.materialOffset,
+        "bones": len(mesh.tri_header.bones),
+        "vertex_stride": stride,
+        "vertex_count": len(mesh.vertices),
+        "shared_vertices": mesh.vertex_block is not None,
+        "index_format": mesh.index_format,
+        "index_count": sum(len(index.vertices) for index in mesh.indices),
+        "prims": len(mesh.indices),
+        "triangles": sum(len(index.to_faces()) for index in mesh.indices),
+        "ge_commands": ge_command_count(mesh),
+    }
+
+
+def texture_report(image: GimImage) -> dict:
+    """VRAM taken by a texture, its swizzled pixels and its CLUT."""
+    clut_bits = CLUT_BITS.get(image.data_type)
+    pixel_bytes = image.data_size - 0x10 if clut_bits is not None else None
+    clut_bytes = image.palette.size - 0x10
+    return {
+        "width": image.width,
+        "height": image.height,
+        "clut_bits": clut_bits,
+        "clut_format": image.palette.type.name,
+        "colors": image.palette.count,
+        "pixel_bytes": pixel_bytes,
+        "clut_bytes": clut_bytes,
+        "vram": None if pixel_bytes is None else pixel_bytes + clut_bytes,
+    }
+
+
+def pmo_report(pmo: pmodel.PMO, tmh: TMH | None = None) -> dict:
+    header = pmo.header
+    sections = dict.fromkeys(SECTIONS, 0)
+    sections["header"] = header.size
+    sections["mesh_headers"] = pmo.mesh_header[0].size * len(pmo.mesh_header)
+    sections["tristrip_headers"] = pmo.tristrips[0].size * len(pmo.tristrips)
+    sections["material_remap"] = len(pmo.mat_remap_data)
+    sections["bone_data"] = len(pmo.bone_data)
+    sections["materials"] = pmo.materials[0].size * len(pmo.materials) if pmo.materials else 0
+
+    mesh_headers = []
+    for header_index, mheader in enumerate(pmo.mesh_header):
+        submeshes = []
+        for mesh in mheader.meshes:
+            sub = submesh_report(mesh)
+            submeshes.append(sub)
+            sections["display_lists"] += sub["ge_commands"] * 4
+            sections["index"] += sum(index.calcsize() for index in mesh.indices)
+            if mesh.vertex_block is None:
+                sections["vertex"] += sub["vertex_stride"] * sub["vertex_count"]
+        sections["vertex"] += sum(block.calcsize() for block in mheader.vertex_blocks)
+        mesh_headers.append({"index": header_index, "vertex_blocks": len(mheader.vertex_blocks), "submeshes": submeshes})
+    sections["padding"] = header.filesize - sum(sections.values())
+
+    submeshes = [sub for mheader in mesh_headers for sub in mheader["submeshes"]]
+    report = {
+        "version": pmo.ver.rstrip(b'\x00').decode(),
+        "filesize": header.filesize,
+        "sections": sections,
+        "totals": {
+            "mesh_headers": len(pmo.mesh_header),
+            "submeshes": len(submeshes),
+            "prims": sum(sub["prims"] for sub in submeshes),
+            "ge_commands": sum(sub["ge_commands"] for sub in submeshes),
+            "vertices": sum(sub["vertex_count"] for sub in submeshes),
+            "triangles": sum(sub["triangles"] for sub in submeshes),
+            "materials": len(pmo.materials),
+        },
+        "mesh_headers": mesh_headers,
+        # before and after counts of the optional build passes
+        "build": {name: list(counts) for name, counts in pmo.build_stats.items()},
+    }
+    if tmh is not None:
+        textures = [texture_report(image) for image in tmh.images]
+        report["textures"] = textures
+        report["totals"]["textures"] = len(textures)
+        report["totals"]["vram"] = sum(tex["vram"] or 0 for tex in textures)
+    return report
+
+
+def pmo_estimate(pmo: pmodel.PMO, tmh: TMH | None = None) -> dict:
+    """What a dry run predicts, the file size and draw counts from the layout and the VRAM of the textures."""
+    meshes = pmo.meshes
+    estimate = {
+        "filesize": pmo.header.filesize,
+        "submeshes": len(meshes),
+        "draws": sum(len(mesh.indices) for mesh in meshes),
+        "ge_commands": sum(ge_command_count(mesh) for mesh in meshes),
+    }
+    if tmh is not None:
+        estimate["textures"] = tmh.img_count
+        estimate["vram"] = sum(texture_report(image)["vram"] or 0 for image in tmh.images)
+    return estimate
+
+
+def format_estimate(estimate: dict) -> str:
+    text = (f'{estimate["filesize"]} bytes, {estimate["submeshes"]} submeshes, {estimate["draws"]} draws, '
+            f'{estimate["ge_commands"]} GE commands')
+    if "vram" in estimate:
+        text += f', {estimate["textures"]} textures in {estimate["vram"]} bytes of VRAM'
+    return text
+
+
+def budget_errors(report: dict, max_bytes: int | None = None, max_commands: int | None = None,
+                  max_vram: int | None = None) -> list[str]:
+    errors = []
+    if max_bytes is not None and report["filesize"] > max_bytes:
+        errors.append(f'File size {report["filesize"]} over budget of {max_bytes} bytes')
+    if max_commands is not None and report["totals"]["ge_commands"] > max_commands:
+        errors.append(f'{report["totals"]["ge_commands"]} GE commands over budget of {max_commands}')
+    if max_vram is not None and report["totals"].get("vram", 0) > max_vram:
+        errors.append(f'Texture VRAM {report["totals"]["vram"]} over budget of {max_vram} bytes')
+    for number, tex in enumerate(report.get("textures", [])):
+        if tex["clut_bits"] is None:
+            errors.append(f'Texture {number} has {tex["colors"]} colors, over 256')
+    return errors
+
+
+def format_report(report: dict) -> str:
+    totals = report["totals"]
+    lines = [f'PMO {report["version"]}: {report["filesize"]} bytes, {totals["mesh_headers"]} mesh headers, '
+             f'{totals["submeshes"]} submeshes, {totals["prims"]} prims, {totals["ge_commands"]} GE commands']
+    for section in SECTIONS:
+        lines.append(f'\t{section}: {report["sections"][section]}')
+    if report.get("build"):
+        lines.append('Build passes:')
+    for name, (before, after) in report.get("build", {}).items():
+        lines.append(f'\t{name}: {before} -> {after}')
+    for header in report["mesh_headers"]:
+        lines.append(f'Mesh header {header["index"]}:')
+        for number, sub in enumerate(header["submeshes"]):
+            lines.append(f'\tSubmesh {number} (material {sub["material"]}, {sub["bones"]} bones): '
+                         f'{sub["vertex_count"]} x {sub["vertex_stride"]} byte vertices, {sub["index_count"]} {sub["index_format"] or "no"} indices, '
+                         f'{sub["prims"]} prims, {sub["ge_commands"]} GE commands')
+    for number, tex in enumerate(report.get("textures", [])):
+        lines.append(f'Texture {number}: {tex["width"]}x{tex["height"]} CLUT{tex["clut_bits"]} {tex["clut_format"]}, '
+                     f'{tex["vram"]} bytes of VRAM')
+    if "vram" in totals:
+        lines.append(f'Texture VRAM: {totals["vram"]} bytes')
+    return "\n".join(lines)
+
+
+def write_report(report: dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m pmo_export.report", description="Report sizes and draw costs of a compiled intermediate file.")
+    parser.add_argument("input", help="Intermediate .npz file")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--max-bytes", type=int, help="Fail if the PMO is larger than this")
+    parser.add_argument("--max-commands", type=int, help="Fail if the display lists have more GE commands than this")
+    parser.add_argument("--max-vram", type=int, help="Fail if the textures take more VRAM than this")
+    parser.add_argument("--elide-states", action="store_true", help="Don't repeat flat shading and face order shared by consecutive submeshes")
+    parser.add_argument("--lists", action="store_true", help="Draw short tristrips as triangle lists when that's smaller")
+    parser.add_argument("--fit-indices", action="store_true", help="Reorder and split submeshes to fit 8 bit indices")
+    parser.add_argument("--merge-objects", action="store_true", help="Combine compatible objects and their submeshes")
+    parser.add_argument("--share-vertices", action="store_true", help="Store each object's vertices once per vertex format")
+    parser.add_argument("--intern-tables", action="store_true", help="Write identical bone palettes and materials once")
+    args = parser.parse_args(argv)
+
+    # the panel imports this module in Blender, where pyffi may not be installed until export_pmo is imported
+    from .compiler import compile_pmo
+    from .mesh_build import BuildOptions
+
+    data = intermediate.load(args.input)
+    # keep anything the builder prints out of the report
+    with redirect_stdout(sys.stderr):
+        options = BuildOptions(elide_states=args.elide_states, use_lists=args.lists, fit_indices=args.fit_indices,
+                               merge_objects=args.merge_objects, share_vertices=args.share_vertices, intern_tables=args.intern_tables)
+        pmo = compile_pmo(data, options)
+        pmo.update()
+    tmh = None
+    if data.bones is not None:  # only PAC intermediates carry textures
+        tmh = TMH()
+        for pixels, width, height in data.textures:
+            tmh.loadPixels(pixels.tolist(), width, height)
+
+    report = pmo_report(pmo, tmh)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+    errors = budget_errors(report, args.max_bytes, args.max_commands, args.max_vram)
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())